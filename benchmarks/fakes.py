@@ -0,0 +1,70 @@
+"""Minimal stand-ins for discord.py objects used to drive cogs offline"""
+
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+_ids = itertools.count(100000000000000000)
+
+def next_id():
+    return next(_ids)
+
+class FakeBot:
+    """Just enough of commands.Bot for the cogs under benchmark"""
+
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.user = SimpleNamespace(id=next_id())
+        self.guilds = []
+        self.channels = {}
+        self.dispatched = []
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_guild(self, guild_id):
+        return next((guild for guild in self.guilds if guild.id == guild_id), None)
+
+    def dispatch(self, event, *args):
+        self.dispatched.append(event)
+
+class FakeMessageable:
+    """Channel or followup webhook that records what was sent"""
+
+    def __init__(self, name='general'):
+        self.id = next_id()
+        self.name = name
+        self.mention = f'<#{self.id}>'
+        self.sent = []
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        self.sent.append((content, embed))
+
+class FakeResponse:
+    def __init__(self):
+        self.sent = []
+        self.deferred = False
+
+    def is_done(self):
+        return self.deferred or bool(self.sent)
+
+    async def defer(self, **kwargs):
+        self.deferred = True
+
+    async def send_message(self, content=None, *, embed=None, **kwargs):
+        self.sent.append((content, embed))
+
+class FakeInteraction:
+    """Interaction carrying a user, guild and channel, with recorded responses"""
+
+    def __init__(self, user, guild, channel=None):
+        self.id = next_id()
+        self.user = user
+        self.guild = guild
+        self.channel = channel or FakeMessageable()
+        self.response = FakeResponse()
+        self.followup = FakeMessageable('followup')
+
+    @property
+    def sent(self):
+        return self.response.sent + self.followup.sent
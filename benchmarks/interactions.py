@@ -0,0 +1,242 @@
+"""Offline load generator for the /serverinfo, /membercount and /avatar commands
+
+Builds synthetic guilds with the requested number of members, loads the
+real ServerCog and AvatarCog and calls their app command callbacks with fake
+interactions, recording every response. For each guild size and command it
+reports throughput, latency percentiles, the cost of the first (cold) call,
+and the peak memory allocated and the blocks still alive after each call, as
+measured by tracemalloc. Nothing connects to Discord and the config database
+lives in a temporary directory.
+
+    python -m benchmarks.interactions --members 10000 100000 500000 --requests 2000
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the cogs' config database out of the repository
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bot.db'))
+
+import discord
+from benchmarks.fakes import FakeBot, FakeInteraction, next_id
+from benchmarks.playback import percentile
+from cogs.avatar import AvatarCog
+from cogs.server import ServerCog
+from utils import runtime
+from utils.member_cache import MemberCache
+
+CREATED_AT = datetime(2020, 1, 1, tzinfo=timezone.utc)
+FEATURES = ['COMMUNITY', 'NEWS', 'BANNER', 'ANIMATED_ICON', 'INVITE_SPLASH', 'THREADS_ENABLED', 'ROLE_ICONS']
+
+class FakeAsset:
+    __slots__ = ('url',)
+
+    def __init__(self, url):
+        self.url = url
+
+    def replace(self, *, format=None, size=None):
+        return FakeAsset(f'{self.url}.{format}?size={size}')
+
+class FakeMember:
+    """Member with only the attributes the commands read, kept small for 500k-member guilds"""
+
+    __slots__ = ('id', 'guild', 'bot', 'status')
+
+    def __init__(self, guild, bot, status):
+        self.id = next_id()
+        self.guild = guild
+        self.bot = bot
+        self.status = status
+
+    @property
+    def display_name(self):
+        return f'member{self.id % 1000000}'
+
+    @property
+    def mention(self):
+        return f'<@{self.id}>'
+
+    @property
+    def display_avatar(self):
+        return FakeAsset(f'https://cdn.example/avatars/{self.id}.png')
+
+    @property
+    def color(self):
+        return discord.Color.default()
+
+    @property
+    def joined_at(self):
+        return CREATED_AT
+
+    @property
+    def created_at(self):
+        return CREATED_AT
+
+    def __str__(self):
+        return self.display_name
+
+class FakeGuild:
+    """Guild whose member list is only cached once it is chunked, like with lazy member caching"""
+
+    def __init__(self, members, seed=0):
+        rng = random.Random(seed)
+        self.id = next_id()
+        self.name = f'Benchmark {members:,}'
+        self.icon = FakeAsset(f'https://cdn.example/icons/{self.id}.png')
+        self.banner = None
+        self.created_at = CREATED_AT
+        self.preferred_locale = discord.Locale.american_english
+        self.features = FEATURES
+        self.premium_tier = 2
+        self.premium_subscription_count = 14
+        self.verification_level = discord.VerificationLevel.medium
+        self.mfa_level = 1
+        self.explicit_content_filter = discord.ContentFilter.all_members
+        self.text_channels = [object() for _ in range(40)]
+        self.voice_channels = [object() for _ in range(10)]
+        self.categories = [object() for _ in range(8)]
+        self.roles = [SimpleNamespace(mention='@everyone')] + [SimpleNamespace(mention=f'<@&{next_id()}>') for _ in range(60)]
+        self.emojis = [SimpleNamespace(animated=index % 4 == 0) for index in range(120)]
+        statuses = (discord.Status.online, discord.Status.idle, discord.Status.offline, discord.Status.offline)
+        self.all_members = [
+            FakeMember(self, rng.random() < 0.05, rng.choice(statuses)) for _ in range(members)
+        ]
+        self.member_count = members
+        self.owner = self.all_members[0]
+        self._members = {}
+        self._voice_states = {}
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def chunked(self):
+        return len(self._members) >= self.member_count
+
+    async def chunk(self, *, cache=True):
+        self._members = {member.id: member for member in self.all_members}
+        return self.members
+
+def make_commands(server, avatar):
+    """Callbacks under benchmark, each taking an interaction and the guild's members"""
+
+    async def serverinfo(interaction, members):
+        await server.serverinfo.callback(server, interaction)
+
+    async def membercount(interaction, members):
+        await server.membercount.callback(server, interaction)
+
+    async def avatar_user(interaction, members):
+        await avatar.avatar.callback(avatar, interaction, user=random.choice(members))
+
+    async def avatar_server(interaction, members):
+        await avatar.avatar.callback(avatar, interaction, server=True)
+
+    return {
+        'serverinfo': serverinfo,
+        'membercount': membercount,
+        'avatar': avatar_user,
+        'avatar server': avatar_server
+    }
+
+async def run_command(command, guild, requests, concurrency, alloc_samples):
+    members = guild.all_members
+    interactions = [FakeInteraction(random.choice(members), guild) for _ in range(requests)]
+    latencies = []
+
+    async def worker(batch):
+        for interaction in batch:
+            start = time.perf_counter()
+            await command(interaction, members)
+            latencies.append(time.perf_counter() - start)
+
+    gc.collect()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(interactions[index::concurrency]) for index in range(concurrency)))
+    wall = time.perf_counter() - start
+    responses = sum(len(interaction.sent) for interaction in interactions)
+
+    # Allocation is measured in a separate pass so tracemalloc does not skew the timings
+    tracemalloc.start()
+    peak = 0
+    blocks = 0
+    for interaction in [FakeInteraction(random.choice(members), guild) for _ in range(alloc_samples)]:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        await command(interaction, members)
+        peak += tracemalloc.get_traced_memory()[1] - current
+        blocks += sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename') if stat.count_diff > 0)
+    tracemalloc.stop()
+
+    return {
+        'throughput': requests / wall,
+        'p50': percentile(latencies, 50) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'max': max(latencies) * 1000,
+        'peak_kib': peak / alloc_samples / 1024,
+        'blocks': blocks / alloc_samples,
+        'responses': responses,
+        'requests': requests
+    }
+
+async def run_size(size, args):
+    loop = asyncio.get_running_loop()
+    bot = FakeBot(loop)
+    bot.member_cache = MemberCache(bot, enabled=True)
+    server = ServerCog(bot)
+    avatar = AvatarCog(bot)
+
+    build_start = time.perf_counter()
+    guild = FakeGuild(size, seed=size)
+    bot.guilds.append(guild)
+    build = time.perf_counter() - build_start
+
+    # The first call chunks the guild and builds the member index and the serverinfo cache
+    cold_start = time.perf_counter()
+    await server.serverinfo.callback(server, FakeInteraction(guild.owner, guild))
+    cold = (time.perf_counter() - cold_start) * 1000
+
+    print(f'\n{size:,} members (built in {build:.1f} s, first /serverinfo {cold:.1f} ms)')
+    print(f"{'command':<14} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'KiB/call':>9} {'new blocks':>11} {'sent':>9}")
+    for name, command in make_commands(server, avatar).items():
+        if args.commands and name.split()[0] not in args.commands:
+            continue
+        result = await run_command(command, guild, args.requests, args.concurrency, args.alloc_samples)
+        print(f"{name:<14} {result['throughput']:>10.0f} {result['p50']:>8.3f} {result['p99']:>8.3f} "
+              f"{result['max']:>8.3f} {result['peak_kib']:>9.1f} {result['blocks']:>11.1f} "
+              f"{result['responses']:>4}/{result['requests']:<4}")
+    cache = server.stats()['serverinfo_cache']
+    print(f"serverinfo cache hit rate {cache['hit_rate']:.1%}, member index drift {server.member_index.drift}")
+
+async def main(args):
+    print(runtime.banner())
+    for size in args.members:
+        await run_size(size, args)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark slash command handling offline')
+    parser.add_argument('--members', type=int, nargs='+', default=[10000, 100000, 500000],
+                        help='member counts of the synthetic guilds')
+    parser.add_argument('--requests', type=int, default=2000, help='interactions per command and guild')
+    parser.add_argument('--concurrency', type=int, default=1, help='interactions in flight at once')
+    parser.add_argument('--alloc-samples', type=int, default=50, help='calls measured with tracemalloc')
+    parser.add_argument('--commands', nargs='+', choices=['serverinfo', 'membercount', 'avatar'],
+                        help='only run these commands')
+    parser.add_argument('--uvloop', action='store_true', help='run on uvloop like FAST_RUNTIME=1')
+    args = parser.parse_args()
+    if args.uvloop:
+        runtime.FAST_RUNTIME = True
+    runtime.run(main(args))
@@ -0,0 +1,268 @@
+"""Offline playback benchmark for the music cog
+
+Drives the /play command of MusicCog against a local audio file and a stub
+voice client that reads 20 ms frames the way discord.py's AudioPlayer does.
+For each concurrency level it reports CPU per stream, frame jitter,
+time-to-first-audio and memory. yt-dlp is never called and no network or
+Discord connection is needed, only ffmpeg.
+
+    python -m benchmarks.playback --streams 1 4 16 --duration 10
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+import cogs.music as music
+from benchmarks.fakes import FakeBot, FakeInteraction, FakeMessageable, next_id
+
+FRAME = 0.02
+
+class FakeVoiceClient:
+    """Voice client whose player thread records the time of every frame"""
+
+    def __init__(self, channel, encoder=None):
+        self.channel = channel
+        self.source = None
+        # Like VoiceClient, the encoder is only set once a PCM source is played
+        self.encoder = discord.utils.MISSING
+        self.pcm_encoder = encoder
+        self.frame_times = []
+        self.first_frame_at = None
+        self._connected = True
+        self._thread = None
+        self._end = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+
+    def is_connected(self):
+        return self._connected
+
+    def is_playing(self):
+        return self._thread is not None and not self._end.is_set() and self._resumed.is_set()
+
+    def is_paused(self):
+        return self._thread is not None and not self._end.is_set() and not self._resumed.is_set()
+
+    def play(self, source, *, after=None):
+        self.source = source
+        if not source.is_opus():
+            self.encoder = self.pcm_encoder
+        self._end.clear()
+        self._thread = threading.Thread(target=self._run, args=(after,), daemon=True)
+        self._thread.start()
+
+    def _run(self, after):
+        # Mirrors the timing loop of discord.player.AudioPlayer
+        loops = 0
+        start = time.perf_counter()
+        while not self._end.is_set():
+            if not self._resumed.is_set():
+                self._resumed.wait()
+                continue
+            data = self.source.read()
+            if not data:
+                break
+            # Without libopus there is nothing to encode with; otherwise a PCM source
+            # swapped in without an encoder fails here like it does on a real voice client
+            if not self.source.is_opus() and self.pcm_encoder is not None:
+                self.encoder.encode(data, self.encoder.SAMPLES_PER_FRAME)
+            now = time.perf_counter()
+            if self.first_frame_at is None:
+                self.first_frame_at = now
+            self.frame_times.append(now)
+            loops += 1
+            time.sleep(max(0, start + FRAME * loops - time.perf_counter()))
+        self.source.cleanup()
+        self._end.set()
+        if after is not None:
+            after(None)
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    def stop(self):
+        self._end.set()
+        self._resumed.set()
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, *, force=False):
+        self._connected = False
+        self.stop()
+
+class FakeVoiceChannel:
+    def __init__(self, encoder=None):
+        self.id = next_id()
+        self.mention = f'<#{self.id}>'
+        self.encoder = encoder
+        self.voice_client = None
+
+    def permissions_for(self, member):
+        return SimpleNamespace(connect=True, speak=True)
+
+    async def connect(self, **kwargs):
+        self.voice_client = FakeVoiceClient(self, self.encoder)
+        return self.voice_client
+
+def make_interaction(channel):
+    guild = SimpleNamespace(id=next_id(), me=SimpleNamespace(), voice_client=None, name='Benchmark')
+    user = SimpleNamespace(
+        id=next_id(),
+        mention='<@benchmark>',
+        voice=SimpleNamespace(channel=channel)
+    )
+    return FakeInteraction(user, guild, FakeMessageable())
+
+def make_audio_file(directory, duration, codec):
+    """Render a test tone with ffmpeg so the benchmark needs no network"""
+    if codec == 'opus':
+        path = os.path.join(directory, 'tone.ogg')
+        encode = ['-c:a', 'libopus', '-b:a', '128k']
+    else:
+        path = os.path.join(directory, 'tone.m4a')
+        encode = ['-c:a', 'aac', '-b:a', '128k']
+    subprocess.run(
+        ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+         '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration + 5}',
+         '-ar', '48000', '-ac', '2', *encode, path],
+        check=True
+    )
+    return path
+
+def load_encoder():
+    """Opus encoder used for PCM sources, like the real voice client"""
+    try:
+        if not discord.opus.is_loaded():
+            discord.opus._load_default()
+        return discord.opus.Encoder()
+    except Exception:
+        return None
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+async def run_level(path, codec, streams, duration, volume, encoder):
+    """Play one track per fake guild and collect timing for every stream"""
+    loop = asyncio.get_running_loop()
+    cog = music.MusicCog(FakeBot(loop))
+    data = {
+        'id': os.path.basename(path),
+        'title': 'Benchmark Tone',
+        'url': path,
+        'duration': duration,
+        'acodec': codec
+    }
+
+    async def fake_extract(query, *, download=False, options=None):
+        return dict(data)
+
+    music.extractor.extract = fake_extract
+    music.extraction_cache.clear()
+    # The reconnect flags only apply to network streams
+    music.ffmpeg_options['before_options'] = ''
+
+    channels = [FakeVoiceChannel(encoder) for _ in range(streams)]
+    interactions = [make_interaction(channel) for channel in channels]
+    for interaction in interactions:
+        cog.get_queue(interaction.guild.id).volume = volume
+
+    cpu_before = os.times()
+    wall_start = time.perf_counter()
+    started = []
+    for interaction in interactions:
+        started.append(time.perf_counter())
+        await cog.play.callback(cog, interaction, f'benchmark {interaction.guild.id}')
+
+    await asyncio.sleep(duration)
+    for interaction in interactions:
+        await cog.stop.callback(cog, interaction)
+    for channel in channels:
+        if channel.voice_client and channel.voice_client._thread:
+            channel.voice_client._thread.join(timeout=5)
+    wall = time.perf_counter() - wall_start
+    cpu_after = os.times()
+
+    cpu = (cpu_after.user - cpu_before.user + cpu_after.system - cpu_before.system
+           + cpu_after.children_user - cpu_before.children_user
+           + cpu_after.children_system - cpu_before.children_system)
+
+    jitter = []
+    first_audio = []
+    for start, channel in zip(started, channels):
+        client = channel.voice_client
+        if client is None or client.first_frame_at is None:
+            continue
+        first_audio.append((client.first_frame_at - start) * 1000)
+        times = client.frame_times
+        jitter.extend(abs(b - a - FRAME) * 1000 for a, b in zip(times, times[1:]))
+
+    passthrough = sum(isinstance(c.voice_client.source, music.YTDLOpusSource) for c in channels if c.voice_client)
+    return {
+        'streams': streams,
+        'passthrough': passthrough,
+        'cpu_per_stream': cpu / wall / streams * 100,
+        'jitter_p50': percentile(jitter, 50),
+        'jitter_p99': percentile(jitter, 99),
+        'jitter_max': max(jitter, default=0.0),
+        'first_audio_p50': statistics.median(first_audio) if first_audio else 0.0,
+        'first_audio_max': max(first_audio, default=0.0),
+        'rss_mb': rss_mb(),
+        'failed': streams - len(first_audio)
+    }
+
+async def main(args):
+    encoder = load_encoder()
+    if encoder is None:
+        print('libopus not found, PCM frames are not encoded (CPU for PCM streams is understated)')
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.file or make_audio_file(directory, args.duration, args.codec)
+        codec = args.codec
+        print(f'file={path} codec={codec} volume={args.volume} duration={args.duration}s')
+        print(f"{'streams':>7} {'pass':>5} {'cpu/stream%':>11} {'jit p50':>8} {'jit p99':>8} "
+              f"{'jit max':>8} {'tfa p50':>8} {'tfa max':>8} {'rss MB':>8} {'fail':>5}")
+        for streams in args.streams:
+            result = await run_level(path, codec, streams, args.duration, args.volume, encoder)
+            print(f"{result['streams']:>7} {result['passthrough']:>5} {result['cpu_per_stream']:>11.2f} "
+                  f"{result['jitter_p50']:>8.2f} {result['jitter_p99']:>8.2f} {result['jitter_max']:>8.2f} "
+                  f"{result['first_audio_p50']:>8.1f} {result['first_audio_max']:>8.1f} "
+                  f"{result['rss_mb']:>8.1f} {result['failed']:>5}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark concurrent music playback offline')
+    parser.add_argument('--streams', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help='concurrency levels to run')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to play at each level')
+    parser.add_argument('--codec', choices=['opus', 'aac'], default='opus', help='codec of the generated test file')
+    parser.add_argument('--volume', type=float, default=1.0, help='playback volume, anything but 1.0 forces the PCM path')
+    parser.add_argument('--file', help='use an existing audio file instead of a generated tone')
+    asyncio.run(main(parser.parse_args()))
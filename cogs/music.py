@@ -1,9 +1,19 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import asyncio
+import itertools
+import os
+import time
+import weakref
+from collections import deque
+from urllib.parse import urlparse, parse_qs
 import yt_dlp
-from utils.embeds import create_embed
+from utils.audio_cache import AudioCache, AUDIO_CACHE_DIR
+from utils.cache import TTLCache, SingleFlight
+from utils.embeds import create_embed, template_embed
+from utils.extractor import ExtractorPool, ExtractorBusy
+from utils.metrics import extraction_duration
 
 # yt-dlp configuration
 ytdl_format_options = {
@@ -24,45 +34,763 @@ ffmpeg_options = {
     'options': '-vn'
 }
 
+# Cached Opus files are played as-is, so streams default to full volume to match them
+DEFAULT_VOLUME = 1.0
+
+# Number of upcoming queue entries resolved in the background while a track plays
+PREFETCH_COUNT = 2
+
+# Playlists are flat-extracted in pages so playback starts after the first page
+PLAYLIST_FIRST_PAGE = 10
+PLAYLIST_PAGE_SIZE = 100
+PLAYLIST_MAX_ENTRIES = int(os.getenv('PLAYLIST_MAX_ENTRIES', 500))
+# A page rejected with ExtractorBusy is retried this many times, waiting longer each time
+PLAYLIST_BUSY_RETRIES = 5
+PLAYLIST_BUSY_BACKOFF = 2
+
+# Idle voice sessions are disconnected by a background reaper
+IDLE_TIMEOUT = int(os.getenv('MUSIC_IDLE_TIMEOUT', 300))
+ALONE_TIMEOUT = int(os.getenv('MUSIC_ALONE_TIMEOUT', 60))
+REAPER_INTERVAL = int(os.getenv('MUSIC_REAPER_INTERVAL', 30))
+
+# How often playing tracks are checked for stream URLs that are about to expire
+STREAM_REFRESH_INTERVAL = 60
+
+# yt-dlp overrides that list playlist entries without resolving their streams
+flat_playlist_options = {
+    'noplaylist': False,
+    'extract_flat': 'in_playlist'
+}
+
+# Extraction cache; entries also expire before the stream URL they contain does
+YTDL_CACHE_SIZE = int(os.getenv('YTDL_CACHE_SIZE', 512))
+YTDL_CACHE_TTL = int(os.getenv('YTDL_CACHE_TTL', 3600))
+STREAM_EXPIRY_MARGIN = 300
+
 ytdl = yt_dlp.YoutubeDL(ytdl_format_options)
+extractor = ExtractorPool(ytdl_format_options, histogram=extraction_duration)
+extraction_cache = TTLCache(maxsize=YTDL_CACHE_SIZE, ttl=YTDL_CACHE_TTL)
+# Concurrent lookups of the same track share one extraction
+extraction_flight = SingleFlight()
+audio_cache = AudioCache(AUDIO_CACHE_DIR) if AUDIO_CACHE_DIR else None
+# Every source that may still own an FFmpeg process, so the reaper can find orphans
+live_sources = weakref.WeakSet()
 
-class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.5):
-        super().__init__(source, volume)
+def youtube_video_id(url):
+    """Return the video ID of a YouTube URL, or None for anything else"""
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    for prefix in ('www.', 'm.', 'music.'):
+        host = host.removeprefix(prefix)
+
+    if host == 'youtu.be':
+        return parsed.path.strip('/').split('/')[0] or None
+    if host == 'youtube.com':
+        if parsed.path == '/watch':
+            return parse_qs(parsed.query).get('v', [None])[0]
+        parts = parsed.path.strip('/').split('/')
+        if len(parts) >= 2 and parts[0] in ('shorts', 'embed', 'live'):
+            return parts[1]
+    return None
+
+def is_playlist_url(url):
+    """Whether a URL points to a whole YouTube playlist rather than one video"""
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    for prefix in ('www.', 'm.', 'music.'):
+        host = host.removeprefix(prefix)
+    return host == 'youtube.com' and parsed.path == '/playlist' and 'list' in parse_qs(parsed.query)
+
+def normalize_query(query):
+    """Map a search query or URL to a stable cache key"""
+    query = ' '.join(query.split())
+    video_id = youtube_video_id(query)
+    if video_id:
+        return f'youtube:{video_id}'
+    # Paths and query strings of other URLs can be case-sensitive
+    if urlparse(query).scheme in ('http', 'https'):
+        return query
+    return query.lower()
+
+def track_key(data):
+    """Canonical cache key of extracted track info"""
+    if data.get('id') and data.get('extractor_key'):
+        return f"{data['extractor_key'].lower()}:{data['id']}"
+    return None
+
+def stream_expiry(data):
+    """Unix time the stream URL expires at, or None if it carries no expiry"""
+    expire = parse_qs(urlparse(data.get('url') or '').query).get('expire')
+    if not expire:
+        return None
+    try:
+        return int(expire[0])
+    except ValueError:
+        return None
+
+def stream_ttl(data):
+    """Seconds the stream URL stays usable, or None if it carries no expiry"""
+    expires_at = stream_expiry(data)
+    if expires_at is None:
+        return None
+    return expires_at - time.time() - STREAM_EXPIRY_MARGIN
+
+def cache_track(query, data):
+    """Store extracted track info under the query and the canonical video ID"""
+    ttl = stream_ttl(data)
+    extraction_cache.set(normalize_query(query), data, ttl=ttl)
+    key = track_key(data)
+    if key:
+        extraction_cache.set(key, data, ttl=ttl)
+
+class TrackInfoMixin:
+    """Expose the track metadata used by the now playing embeds and track playback position"""
+
+    def set_track_info(self, data, start=0, local=False):
         self.data = data
         self.title = data.get('title')
         self.url = data.get('url')
         self.duration = data.get('duration')
         self.thumbnail = data.get('thumbnail')
+        self.start = start
+        self.frames = 0
+        self.bytes_read = 0
+        self.guild_id = None
+        # Local files never expire, remote stream URLs usually do
+        self.expires_at = None if local else stream_expiry(data)
+        live_sources.add(self)
+
+    @property
+    def position(self):
+        """Seconds into the track, counted from the 20 ms frames sent so far"""
+        return self.start + self.frames * 0.02
+
+    @property
+    def process(self):
+        """The FFmpeg process feeding this source while it is still running"""
+        source = getattr(self, 'original', self)
+        process = getattr(source, '_process', None)
+        if process and process.poll() is None:
+            return process
+        return None
+
+    def read(self):
+        data = super().read()
+        if data:
+            self.frames += 1
+            self.bytes_read += len(data)
+        return data
+
+class YTDLOpusSource(TrackInfoMixin, discord.FFmpegOpusAudio):
+    """Source that sends Opus packets straight to Discord without re-encoding"""
+
+    def __init__(self, source, *, data, start=0, local=False, **kwargs):
+        super().__init__(source, codec='copy', **kwargs)
+        self.set_track_info(data, start, local)
+
+class YTDLSource(TrackInfoMixin, discord.PCMVolumeTransformer):
+    def __init__(self, source, *, data, volume=DEFAULT_VOLUME, start=0, local=False):
+        super().__init__(source, volume)
+        self.set_track_info(data, start, local)
+
+    @classmethod
+    async def extract(cls, url, *, loop=None, stream=True, refresh=False):
+        """Run yt-dlp extraction in the extractor pool and return the track info
+
+        refresh skips the extraction cache, to get a new stream URL for a track.
+        """
+        if not stream:
+            data = await extractor.extract(url, download=True)
+            return data['entries'][0] if 'entries' in data else data
+
+        key = normalize_query(url)
+        cached = None if refresh else extraction_cache.get(key)
+        if cached is not None:
+            return cached
+
+        async def lookup():
+            data = await extractor.extract(url, download=False)
+            if 'entries' in data:
+                data = data['entries'][0]
+            cache_track(url, data)
+            return data
+
+        return await extraction_flight.run(key, lookup)
+
+    @classmethod
+    async def extract_playlist(cls, url, start, end):
+        """Flat-extract entries start to end (1-based) of a playlist without resolving streams"""
+        options = dict(flat_playlist_options, playlist_items=f'{start}-{end}')
+        data = await extractor.extract(url, options=options)
+        entries = [entry for entry in data.get('entries') or [] if entry]
+        return data, entries
+
+    @classmethod
+    def from_data(cls, data, *, stream=True, volume=DEFAULT_VOLUME, start=0):
+        """Create an audio source from already extracted track info
+
+        Opus tracks played at full volume are passed through without re-encoding,
+        everything else is decoded to PCM so the volume can be scaled.
+        """
+        before_options = ffmpeg_options['before_options']
+        opus = stream and data.get('acodec') == 'opus'
+        filename = None
+        local = not stream
+
+        key = track_key(data)
+        if stream and audio_cache is not None and key:
+            filename = audio_cache.get(key)
+            if filename:
+                before_options, opus, local = '', True, True
+            elif not start:
+                audio_cache.record_play(key, data)
+
+        if filename is None:
+            filename = data['url'] if stream else ytdl.prepare_filename(data)
+
+        if start:
+            before_options = f'-ss {start:.2f} {before_options}'.strip()
+
+        if opus and volume == 1.0:
+            return YTDLOpusSource(
+                filename, data=data, start=start, local=local,
+                before_options=before_options, options=ffmpeg_options['options']
+            )
+
+        source = discord.FFmpegPCMAudio(filename, before_options=before_options, options=ffmpeg_options['options'])
+        return cls(source, data=data, volume=volume, start=start, local=local)
 
     @classmethod
     async def from_url(cls, url, *, loop=None, stream=False):
-        loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=not stream))
+        data = await cls.extract(url, loop=loop, stream=stream)
+        return cls.from_data(data, stream=stream)
+
+class QueueEntry:
+    """A requested track waiting in a guild queue"""
 
-        if 'entries' in data:
-            data = data['entries'][0]
+    def __init__(self, query, requester, title=None):
+        self.query = query
+        self.requester = requester
+        self.title = title
+        self.data = None
+        self.task = None
 
-        filename = data['url'] if stream else ytdl.prepare_filename(data)
-        return cls(discord.FFmpegPCMAudio(filename, **ffmpeg_options), data=data)
+    @property
+    def display_title(self):
+        if self.data and self.data.get('title'):
+            return self.data['title']
+        return self.title or self.query
+
+    def prefetch(self, loop):
+        """Start resolving the track in the background if not started yet"""
+        if self.data is None and self.task is None:
+            self.task = loop.create_task(YTDLSource.extract(self.query, loop=loop, stream=True))
+            # Mark failures as retrieved; they are reported when the entry is played
+            self.task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def resolve(self, loop):
+        """Return the track info, waiting for the prefetch if one is running"""
+        # Prefetched stream URLs can expire while the entry waits in a long queue
+        if self.data is not None and (stream_ttl(self.data) or 0) < 0:
+            self.data = None
+            self.task = None
+        # A failed or cancelled prefetch (e.g. ExtractorBusy in the background) gets another try
+        if self.task is not None and self.task.done() and (self.task.cancelled() or self.task.exception()):
+            self.task = None
+        if self.data is None:
+            self.prefetch(loop)
+            self.data = await self.task
+        return self.data
+
+    def cancel(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+class MusicQueue:
+    """Per-guild track queue that prefetches the next entries while a track plays"""
+
+    def __init__(self, loop, prefetch_count=PREFETCH_COUNT):
+        self.loop = loop
+        self.prefetch_count = prefetch_count
+        self.entries = deque()
+        self.current = None
+        self.text_channel = None
+        self.volume = DEFAULT_VOLUME
+        # Background tasks still adding playlist entries to this queue
+        self.loaders = set()
+        # Resource accounting, read by the reaper and /musicstats
+        self.player = None
+        self.bytes_streamed = 0
+        self.tracks_played = 0
+        self.idle_since = None
+        self.alone_since = None
+        # Set by /skip so an early track end is not mistaken for an expired stream
+        self.skipped = False
+        self.refreshing = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        self.entries.append(entry)
+        self.schedule_prefetch()
+        return len(self.entries)
+
+    def next(self):
+        """Pop the next entry, or return None when the queue is empty"""
+        return self.entries.popleft() if self.entries else None
+
+    def schedule_prefetch(self):
+        """Resolve the next entries in the background so playback can chain without a gap"""
+        for entry in itertools.islice(self.entries, self.prefetch_count):
+            entry.prefetch(self.loop)
+
+    def set_player(self, player):
+        """Record the source now playing, adding the previous one to the totals"""
+        if self.player is not None:
+            self.bytes_streamed += self.player.bytes_read
+        self.player = player
+
+    @property
+    def total_bytes(self):
+        return self.bytes_streamed + (self.player.bytes_read if self.player else 0)
+
+    def clear(self):
+        for task in self.loaders:
+            task.cancel()
+        self.loaders.clear()
+        for entry in self.entries:
+            entry.cancel()
+        self.entries.clear()
+        self.current = None
 
 class MusicCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.voice_clients = {}
+        self.queues = {}
+        self.untracked = set()
+
+    async def cog_load(self):
+        self.reaper.start()
+        self.stream_refresher.start()
+
+    def cog_unload(self):
+        self.reaper.cancel()
+        self.stream_refresher.cancel()
+        extractor.shutdown()
+
+    def get_queue(self, guild_id):
+        """Get or create the queue for a guild"""
+        if guild_id not in self.queues:
+            self.queues[guild_id] = MusicQueue(self.bot.loop)
+        return self.queues[guild_id]
+
+    def now_playing_embed(self, player, requester, channel):
+        """Create the embed announcing a track that started playing"""
+        embed = create_embed(
+            title="🎵 Now Playing",
+            description=f"**{player.title}**",
+            color=discord.Color.blue()
+        )
+        embed.add_field(name="Requested by", value=requester.mention, inline=True)
+        embed.add_field(name="Channel", value=channel.mention, inline=True)
+
+        if hasattr(player, 'duration') and player.duration:
+            duration = int(player.duration)
+            embed.add_field(name="Duration", value=f"{duration // 60}:{duration % 60:02d}", inline=True)
+
+        if hasattr(player, 'thumbnail') and player.thumbnail:
+            embed.set_thumbnail(url=player.thumbnail)
+
+        return embed
+
+    def start_playback(self, guild_id, voice_client, data):
+        """Start playing resolved track info and chain the next track when it ends"""
+        queue = self.get_queue(guild_id)
+        player = YTDLSource.from_data(data, volume=queue.volume)
+        player.guild_id = guild_id
+        voice_client.play(player, after=lambda e: self.after_playback(guild_id, e))
+        queue.set_player(player)
+        queue.tracks_played += 1
+        queue.skipped = False
+        queue.schedule_prefetch()
+        return player
+
+    def swap_source(self, guild_id, voice_client, player):
+        """Replace the source of the playing track, keeping it paused if it was"""
+        queue = self.get_queue(guild_id)
+        old_player = voice_client.source
+        paused = voice_client.is_paused()
+        player.guild_id = guild_id
+        # play() only creates an encoder when the first source is PCM, so a track
+        # started as Opus passthrough has none to encode a PCM replacement with
+        if not player.is_opus() and not voice_client.encoder:
+            voice_client.encoder = discord.opus.Encoder()
+        voice_client.source = player
+        # Changing the source resumes the player
+        if paused:
+            voice_client.pause()
+        queue.set_player(player)
+        # The audio thread may still be inside a read of the old source, so give
+        # it a moment before killing its FFmpeg process
+        if old_player is not None:
+            self.bot.loop.call_later(1, old_player.cleanup)
+
+    def stream_interrupted(self, queue):
+        """Whether the last track ended early because its stream URL expired"""
+        player = queue.player
+        return (
+            player is not None and not queue.skipped and queue.current is not None
+            and player.expires_at is not None and time.time() >= player.expires_at
+            and player.duration and player.position < player.duration - 5
+        )
+
+    async def refresh_stream(self, guild_id, player):
+        """Re-resolve the stream URL of a track and continue it from the same position"""
+        queue = self.queues.get(guild_id)
+        voice_client = self.voice_clients.get(guild_id)
+        if queue is None or voice_client is None or queue.refreshing:
+            return False
+
+        url = player.data.get('webpage_url') or player.data.get('original_url')
+        if not url and queue.current is not None:
+            url = queue.current.query
+        if not url:
+            return False
+
+        queue.refreshing = True
+        try:
+            data = await YTDLSource.extract(url, refresh=True)
+        except Exception as e:
+            print(f'Failed to refresh stream for {player.title}: {e}')
+            return False
+        finally:
+            queue.refreshing = False
+
+        # The track may have been skipped or stopped while resolving
+        if self.queues.get(guild_id) is not queue or queue.player is not player or not voice_client.is_connected():
+            return False
+
+        if queue.current is not None:
+            queue.current.data = data
+        new_player = YTDLSource.from_data(data, volume=queue.volume, start=player.position)
+        if voice_client.source is player and (voice_client.is_playing() or voice_client.is_paused()):
+            self.swap_source(guild_id, voice_client, new_player)
+        else:
+            new_player.guild_id = guild_id
+            voice_client.play(new_player, after=lambda e: self.after_playback(guild_id, e))
+            queue.set_player(new_player)
+        return True
+
+    @tasks.loop(seconds=STREAM_REFRESH_INTERVAL)
+    async def stream_refresher(self):
+        """Re-resolve playing tracks shortly before their stream URL expires"""
+        deadline = time.time() + STREAM_EXPIRY_MARGIN
+        for guild_id, voice_client in list(self.voice_clients.items()):
+            player = voice_client.source
+            if isinstance(player, TrackInfoMixin) and voice_client.is_playing() \
+                    and player.expires_at is not None and player.expires_at <= deadline:
+                await self.refresh_stream(guild_id, player)
+
+    @stream_refresher.before_loop
+    async def before_stream_refresher(self):
+        await self.bot.wait_until_ready()
+
+    def after_playback(self, guild_id, error):
+        """Called from the audio thread when a track finishes"""
+        if error:
+            print(f'Player error: {error}')
+        future = asyncio.run_coroutine_threadsafe(self.play_next(guild_id), self.bot.loop)
+        future.add_done_callback(lambda f: self.play_next_done(guild_id, f))
+
+    def play_next_done(self, guild_id, future):
+        # Exceptions from run_coroutine_threadsafe futures are otherwise never reported
+        if not future.cancelled() and future.exception() is not None:
+            print(f'Failed to play the next track in {guild_id}: {future.exception()!r}')
+
+    async def play_next(self, guild_id):
+        """Play the next queued track, skipping entries that fail to resolve"""
+        queue = self.queues.get(guild_id)
+        voice_client = self.voice_clients.get(guild_id)
+        if queue is None or voice_client is None or not voice_client.is_connected():
+            return
+
+        # Pick the track up where it stopped instead of skipping it
+        if self.stream_interrupted(queue) and await self.refresh_stream(guild_id, queue.player):
+            return
+
+        while True:
+            entry = queue.next()
+            queue.current = entry
+            if entry is None:
+                return
+
+            try:
+                data = await entry.resolve(self.bot.loop)
+            except Exception as e:
+                print(f'Failed to load queued track {entry.query}: {e}')
+                await self.announce_skip(queue, entry)
+                continue
+
+            # The session may have been stopped while the track was resolving
+            if self.queues.get(guild_id) is not queue or not voice_client.is_connected():
+                return
+
+            try:
+                player = self.start_playback(guild_id, voice_client, data)
+            except Exception as e:
+                # FFmpeg failed to start or the voice client refused the source
+                print(f'Failed to play queued track {entry.query}: {e}')
+                queue.current = None
+                await self.announce_skip(queue, entry)
+                continue
+            break
+
+        if queue.text_channel:
+            embed = self.now_playing_embed(player, entry.requester, voice_client.channel)
+            try:
+                await queue.text_channel.send(embed=embed)
+            except discord.HTTPException as e:
+                print(f'Failed to announce track: {e}')
+
+    async def announce_skip(self, queue, entry):
+        """Tell the queue's text channel that a track could not be played"""
+        if not queue.text_channel:
+            return
+        embed = create_embed(
+            title="❌ Error Loading Audio",
+            description=f"Could not load **{entry.query}**, skipping to the next track.",
+            color=discord.Color.red()
+        )
+        try:
+            await queue.text_channel.send(embed=embed)
+        except discord.HTTPException as e:
+            print(f'Failed to announce skipped track: {e}')
+
+    async def disconnect_guild(self, guild_id):
+        """Clear the queue and leave the voice channel of a guild"""
+        voice_client = self.voice_clients.pop(guild_id, None)
+        queue = self.queues.pop(guild_id, None)
+        if queue is not None:
+            queue.set_player(None)
+            queue.clear()
+        if voice_client is not None:
+            await voice_client.disconnect(force=True)
+        return queue
+
+    def stats(self):
+        """Queue depths, FFmpeg processes and extractor load for monitoring"""
+        lengths = [len(queue) for queue in self.queues.values()]
+        return {
+            'voice_sessions': len(self.voice_clients),
+            'queued_tracks': sum(lengths),
+            'longest_queue': max(lengths, default=0),
+            'ffmpeg_processes': sum(1 for source in list(live_sources) if source.process),
+            'extractor': extractor.stats(),
+            'extraction_cache': extraction_cache.stats(),
+            'extraction_flight': extraction_flight.stats()
+        }
+
+    def resource_usage(self, guild_id=None):
+        """Per-guild voice connections, FFmpeg processes and bytes streamed"""
+        usage = {}
+        for gid in set(self.voice_clients) | set(self.queues):
+            if guild_id is not None and gid != guild_id:
+                continue
+            voice_client = self.voice_clients.get(gid)
+            queue = self.queues.get(gid)
+            usage[gid] = {
+                'connected': voice_client is not None and voice_client.is_connected(),
+                'playing': voice_client is not None and voice_client.is_playing(),
+                'ffmpeg_processes': sum(1 for source in list(live_sources) if source.guild_id == gid and source.process),
+                'queue_length': len(queue) if queue else 0,
+                'tracks_played': queue.tracks_played if queue else 0,
+                'bytes_streamed': queue.total_bytes if queue else 0
+            }
+        return usage
+
+    @tasks.loop(seconds=REAPER_INTERVAL)
+    async def reaper(self):
+        """Disconnect idle or abandoned voice sessions and kill orphaned FFmpeg processes"""
+        now = time.monotonic()
+
+        # Voice connections dropped by Discord (kicked, channel deleted) or never tracked
+        for guild_id, voice_client in list(self.voice_clients.items()):
+            if not voice_client.is_connected():
+                await self.disconnect_guild(guild_id)
+        # Untracked clients get one sweep of grace since /play registers them after connecting
+        untracked = set()
+        for voice_client in list(self.bot.voice_clients):
+            guild = getattr(voice_client, 'guild', None)
+            if guild is None or self.voice_clients.get(guild.id) is voice_client:
+                continue
+            if id(voice_client) in self.untracked:
+                await voice_client.disconnect(force=True)
+            else:
+                untracked.add(id(voice_client))
+        self.untracked = untracked
+
+        for guild_id, voice_client in list(self.voice_clients.items()):
+            queue = self.get_queue(guild_id)
+            if voice_client.is_playing() or (queue.current is not None and not voice_client.is_paused()):
+                queue.idle_since = None
+            elif queue.idle_since is None:
+                queue.idle_since = now
+
+            listeners = [member for member in voice_client.channel.members if not member.bot]
+            if listeners:
+                queue.alone_since = None
+            elif queue.alone_since is None:
+                queue.alone_since = now
+
+            if queue.alone_since is not None and now - queue.alone_since >= ALONE_TIMEOUT:
+                reason = "Everyone left the voice channel."
+            elif queue.idle_since is not None and now - queue.idle_since >= IDLE_TIMEOUT:
+                reason = "Nothing has been playing for a while."
+            else:
+                continue
+
+            text_channel = queue.text_channel
+            await self.disconnect_guild(guild_id)
+            if text_channel:
+                embed = create_embed(
+                    title="👋 Left Voice Channel",
+                    description=f"{reason} Use `/play` to start again.",
+                    color=discord.Color.blue()
+                )
+                try:
+                    await text_channel.send(embed=embed)
+                except discord.HTTPException:
+                    pass
+
+        # FFmpeg processes whose source is no longer played by any voice client
+        playing = {id(voice_client.source) for voice_client in self.voice_clients.values() if voice_client.source}
+        for source in list(live_sources):
+            if source.process and id(source) not in playing:
+                print(f'Killing orphaned FFmpeg process {source.process.pid} for guild {source.guild_id}')
+                source.cleanup()
+
+    @reaper.before_loop
+    async def before_reaper(self):
+        await self.bot.wait_until_ready()
+
+    def playlist_entries(self, entries, requester):
+        """Turn flat playlist entries into queue entries resolved just in time"""
+        queue_entries = []
+        for entry in entries:
+            url = entry.get('url') or entry.get('webpage_url') or entry.get('id')
+            if url:
+                queue_entries.append(QueueEntry(url, requester, title=entry.get('title')))
+        return queue_entries
+
+    async def enqueue_playlist(self, interaction, voice_client, queue, url):
+        """Queue the first page of a playlist and load the rest in the background"""
+        try:
+            data, entries = await YTDLSource.extract_playlist(url, 1, PLAYLIST_FIRST_PAGE)
+        except ExtractorBusy:
+            embed = template_embed('music_busy')
+            await interaction.followup.send(embed=embed)
+            return
+        except Exception as e:
+            embed = create_embed(
+                title="❌ Error Loading Playlist",
+                description=f"Could not load the playlist: **{url}**",
+                color=discord.Color.red()
+            )
+            await interaction.followup.send(embed=embed)
+            return
+
+        queue_entries = self.playlist_entries(entries, interaction.user)
+        if not queue_entries:
+            embed = create_embed(
+                title="❌ Empty Playlist",
+                description="That playlist has no playable tracks.",
+                color=discord.Color.red()
+            )
+            await interaction.followup.send(embed=embed)
+            return
+
+        idle = queue.current is None and not voice_client.is_playing() and not voice_client.is_paused()
+        for entry in queue_entries:
+            queue.add(entry)
+
+        more = len(entries) >= PLAYLIST_FIRST_PAGE and PLAYLIST_MAX_ENTRIES > PLAYLIST_FIRST_PAGE
+        embed = create_embed(
+            title="📃 Playlist Added",
+            description=f"**{data.get('title') or url}**",
+            color=discord.Color.blue()
+        )
+        embed.add_field(name="Requested by", value=interaction.user.mention, inline=True)
+        embed.add_field(
+            name="Tracks",
+            value=f"{len(queue_entries)}+ (loading more...)" if more else len(queue_entries),
+            inline=True
+        )
+        await interaction.followup.send(embed=embed)
+
+        if more:
+            task = self.bot.loop.create_task(
+                self.load_playlist(interaction.guild.id, queue, url, interaction.user, PLAYLIST_FIRST_PAGE + 1)
+            )
+            queue.loaders.add(task)
+            task.add_done_callback(queue.loaders.discard)
+
+        if idle:
+            await self.play_next(interaction.guild.id)
+
+    async def extract_playlist_page(self, url, start, end):
+        """Flat-extract one playlist page, waiting out a busy extractor pool"""
+        for attempt in range(PLAYLIST_BUSY_RETRIES):
+            try:
+                _, entries = await YTDLSource.extract_playlist(url, start, end)
+                return entries
+            except ExtractorBusy:
+                await asyncio.sleep(PLAYLIST_BUSY_BACKOFF * (attempt + 1))
+        _, entries = await YTDLSource.extract_playlist(url, start, end)
+        return entries
+
+    async def load_playlist(self, guild_id, queue, url, requester, start):
+        """Keep adding playlist pages to the queue until the playlist or the limit ends"""
+        while start <= PLAYLIST_MAX_ENTRIES:
+            end = min(start + PLAYLIST_PAGE_SIZE - 1, PLAYLIST_MAX_ENTRIES)
+            try:
+                entries = await self.extract_playlist_page(url, start, end)
+            except Exception as e:
+                print(f'Failed to load playlist page {start}-{end} of {url}: {e}')
+                if self.queues.get(guild_id) is queue and queue.text_channel:
+                    embed = create_embed(
+                        title="⚠️ Playlist Incomplete",
+                        description=f"Could not load the rest of the playlist, stopped after the first {start - 1} entries.",
+                        color=discord.Color.orange()
+                    )
+                    try:
+                        await queue.text_channel.send(embed=embed)
+                    except discord.HTTPException as e:
+                        print(f'Failed to announce incomplete playlist: {e}')
+                return
+
+            if self.queues.get(guild_id) is not queue:
+                return
+            for entry in self.playlist_entries(entries, requester):
+                queue.add(entry)
+
+            voice_client = self.voice_clients.get(guild_id)
+            if queue.current is None and voice_client and not voice_client.is_playing() and not voice_client.is_paused():
+                await self.play_next(guild_id)
+
+            if len(entries) < end - start + 1:
+                return
+            start = end + 1
 
     @app_commands.command(name="play", description="Play music from YouTube")
-    @app_commands.describe(query="Song title or YouTube URL")
+    @app_commands.describe(query="Song title, YouTube URL or YouTube playlist URL")
     async def play(self, interaction: discord.Interaction, query: str):
-        """Play music from YouTube"""
+        """Play music from YouTube, or add it to the queue if something is playing"""
         
         # Check if user is in a voice channel
         if not interaction.user.voice:
-            embed = create_embed(
-                title="❌ Not in Voice Channel",
-                description="You need to join a voice channel first to use this command.",
-                color=discord.Color.red()
-            )
+            embed = template_embed('not_in_voice')
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
@@ -71,11 +799,7 @@ class MusicCog(commands.Cog):
         # Check bot permissions
         permissions = channel.permissions_for(interaction.guild.me)
         if not permissions.connect or not permissions.speak:
-            embed = create_embed(
-                title="❌ Missing Permissions",
-                description="I need permission to connect and speak in voice channels.",
-                color=discord.Color.red()
-            )
+            embed = template_embed('missing_voice_permissions')
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
         
@@ -113,13 +837,41 @@ class MusicCog(commands.Cog):
                     await interaction.followup.send(embed=embed)
                     return
 
-            # Stop current audio if playing
-            if voice_client.is_playing():
-                voice_client.stop()
+            queue = self.get_queue(interaction.guild.id)
+            queue.text_channel = interaction.channel
+
+            if is_playlist_url(query):
+                await self.enqueue_playlist(interaction, voice_client, queue, query)
+                return
+
+            entry = QueueEntry(query, interaction.user)
+
+            # Something is already playing, queue the track and resolve it in the background
+            if queue.current is not None or voice_client.is_playing() or voice_client.is_paused():
+                position = queue.add(entry)
+                embed = create_embed(
+                    title="📝 Added to Queue",
+                    description=f"**{query}**",
+                    color=discord.Color.blue()
+                )
+                embed.add_field(name="Requested by", value=interaction.user.mention, inline=True)
+                embed.add_field(name="Position", value=position, inline=True)
+                await interaction.followup.send(embed=embed)
+                return
+
+            # Claim the player before resolving so concurrent /play calls get queued
+            queue.current = entry
 
             # Create the audio source
             try:
-                player = await YTDLSource.from_url(query, loop=self.bot.loop, stream=True)
+                data = await entry.resolve(self.bot.loop)
+            except ExtractorBusy:
+                embed = template_embed('music_busy')
+                await interaction.followup.send(embed=embed)
+                queue.current = None
+                if len(queue):
+                    await self.play_next(interaction.guild.id)
+                return
             except Exception as e:
                 embed = create_embed(
                     title="❌ Error Loading Audio",
@@ -127,27 +879,27 @@ class MusicCog(commands.Cog):
                     color=discord.Color.red()
                 )
                 await interaction.followup.send(embed=embed)
+                queue.current = None
+                if len(queue):
+                    await self.play_next(interaction.guild.id)
+                return
+
+            # The session may have been stopped while the track was resolving
+            if self.queues.get(interaction.guild.id) is not queue or not voice_client.is_connected():
+                embed = template_embed('not_connected')
+                await interaction.followup.send(embed=embed)
                 return
 
             # Play the audio
-            voice_client.play(player, after=lambda e: print(f'Player error: {e}') if e else None)
+            try:
+                player = self.start_playback(interaction.guild.id, voice_client, data)
+            except Exception:
+                # Release the player so later /play calls don't queue behind a track that never started
+                queue.current = None
+                raise
 
             # Create embed with song info
-            embed = create_embed(
-                title="🎵 Now Playing",
-                description=f"**{player.title}**",
-                color=discord.Color.blue()
-            )
-            embed.add_field(name="Requested by", value=interaction.user.mention, inline=True)
-            embed.add_field(name="Channel", value=channel.mention, inline=True)
-            
-            if hasattr(player, 'duration') and player.duration:
-                duration = f"{player.duration // 60}:{player.duration % 60:02d}"
-                embed.add_field(name="Duration", value=duration, inline=True)
-            
-            if hasattr(player, 'thumbnail') and player.thumbnail:
-                embed.set_thumbnail(url=player.thumbnail)
-
+            embed = self.now_playing_embed(player, interaction.user, channel)
             await interaction.followup.send(embed=embed)
 
         except Exception as e:
@@ -158,14 +910,129 @@ class MusicCog(commands.Cog):
             )
             await interaction.followup.send(embed=embed)
 
+    @app_commands.command(name="skip", description="Skip the current track")
+    async def skip(self, interaction: discord.Interaction):
+        """Skip the current track and play the next one in the queue"""
+        
+        voice_client = self.voice_clients.get(interaction.guild.id)
+        if voice_client is None:
+            embed = template_embed('not_connected')
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        if not voice_client.is_playing() and not voice_client.is_paused():
+            embed = template_embed('not_playing')
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        # Stopping triggers the after callback, which starts the next track
+        self.get_queue(interaction.guild.id).skipped = True
+        voice_client.stop()
+        embed = create_embed(
+            title="⏭️ Track Skipped",
+            description=f"{len(self.get_queue(interaction.guild.id))} track(s) left in the queue.",
+            color=discord.Color.blue()
+        )
+        await interaction.response.send_message(embed=embed)
+
+    @app_commands.command(name="queue", description="Show the music queue")
+    async def show_queue(self, interaction: discord.Interaction):
+        """Show the upcoming tracks"""
+        
+        queue = self.queues.get(interaction.guild.id)
+        if queue is None or (queue.current is None and not len(queue)):
+            embed = template_embed('queue_empty')
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        lines = []
+        for index, entry in enumerate(itertools.islice(queue.entries, 10), start=1):
+            lines.append(f"**{index}.** {entry.display_title} - {entry.requester.mention}")
+
+        embed = create_embed(
+            title="🎶 Music Queue",
+            description="\n".join(lines) if lines else "No upcoming tracks.",
+            color=discord.Color.blue()
+        )
+        if queue.current is not None:
+            embed.add_field(name="Now Playing", value=queue.current.display_title, inline=False)
+        if len(queue) > 10:
+            embed.set_footer(text=f"And {len(queue) - 10} more track(s)")
+        await interaction.response.send_message(embed=embed)
+
+    @app_commands.command(name="musicstats", description="Show music resource usage (Administrator only)")
+    async def music_stats(self, interaction: discord.Interaction):
+        """Show voice, FFmpeg and streaming usage for this server and the bot"""
+        
+        if not interaction.user.guild_permissions.administrator:
+            embed = template_embed('permission_denied')
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        usage = self.resource_usage()
+        guild_usage = usage.get(interaction.guild.id)
+
+        embed = create_embed(
+            title="📈 Music Resource Usage",
+            color=discord.Color.blue()
+        )
+        if guild_usage:
+            embed.add_field(
+                name="This Server",
+                value=f"**Connected:** {'Yes' if guild_usage['connected'] else 'No'}\n"
+                      f"**FFmpeg Processes:** {guild_usage['ffmpeg_processes']}\n"
+                      f"**Queue:** {guild_usage['queue_length']}\n"
+                      f"**Tracks Played:** {guild_usage['tracks_played']}\n"
+                      f"**Streamed:** {guild_usage['bytes_streamed'] / 1024 ** 2:.1f} MB",
+                inline=True
+            )
+        else:
+            embed.add_field(name="This Server", value="No active music session.", inline=True)
+
+        embed.add_field(
+            name="All Servers",
+            value=f"**Connections:** {sum(1 for u in usage.values() if u['connected'])}\n"
+                  f"**FFmpeg Processes:** {sum(1 for source in list(live_sources) if source.process)}\n"
+                  f"**Streamed:** {sum(u['bytes_streamed'] for u in usage.values()) / 1024 ** 2:.1f} MB",
+            inline=True
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="volume", description="Change the music volume")
+    @app_commands.describe(percent="Volume from 0 to 200 percent")
+    async def volume(self, interaction: discord.Interaction, percent: app_commands.Range[int, 0, 200]):
+        """Change the playback volume for this server"""
+        
+        voice_client = self.voice_clients.get(interaction.guild.id)
+        if voice_client is None:
+            embed = template_embed('not_connected')
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        queue = self.get_queue(interaction.guild.id)
+        queue.volume = percent / 100
+
+        player = voice_client.source
+        if isinstance(player, YTDLSource):
+            player.volume = queue.volume
+        elif isinstance(player, YTDLOpusSource) and queue.volume != 1.0:
+            # Passthrough audio cannot be scaled, switch to the PCM path at the current position
+            new_player = YTDLSource.from_data(player.data, volume=queue.volume, start=player.position)
+            self.swap_source(interaction.guild.id, voice_client, new_player)
+
+        embed = create_embed(
+            title="🔊 Volume Changed",
+            description=f"Volume set to **{percent}%**.",
+            color=discord.Color.blue()
+        )
+        await interaction.response.send_message(embed=embed)
+
     @app_commands.command(name="stop", description="Stop music and disconnect from voice channel")
     async def stop(self, interaction: discord.Interaction):
         """Stop music and disconnect"""
         
         if interaction.guild.id in self.voice_clients:
-            voice_client = self.voice_clients[interaction.guild.id]
-            await voice_client.disconnect()
-            del self.voice_clients[interaction.guild.id]
+            await self.disconnect_guild(interaction.guild.id)
             
             embed = create_embed(
                 title="⏹️ Music Stopped",
@@ -174,11 +1041,7 @@ class MusicCog(commands.Cog):
             )
             await interaction.response.send_message(embed=embed)
         else:
-            embed = create_embed(
-                title="❌ Not Playing",
-                description="I'm not currently playing music.",
-                color=discord.Color.red()
-            )
+            embed = template_embed('not_playing')
             await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @app_commands.command(name="pause", description="Pause current music")
@@ -196,18 +1059,10 @@ class MusicCog(commands.Cog):
                 )
                 await interaction.response.send_message(embed=embed)
             else:
-                embed = create_embed(
-                    title="❌ Not Playing",
-                    description="No music is currently playing.",
-                    color=discord.Color.red()
-                )
+                embed = template_embed('not_playing')
                 await interaction.response.send_message(embed=embed, ephemeral=True)
         else:
-            embed = create_embed(
-                title="❌ Not Connected",
-                description="I'm not connected to a voice channel.",
-                color=discord.Color.red()
-            )
+            embed = template_embed('not_connected')
             await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @app_commands.command(name="resume", description="Resume paused music")
@@ -217,26 +1072,27 @@ class MusicCog(commands.Cog):
         if interaction.guild.id in self.voice_clients:
             voice_client = self.voice_clients[interaction.guild.id]
             if voice_client.is_paused():
+                player = voice_client.source
+                # The stream URL may have expired during a long pause
+                if isinstance(player, TrackInfoMixin) and player.expires_at is not None \
+                        and player.expires_at <= time.time() + STREAM_EXPIRY_MARGIN:
+                    await interaction.response.defer()
+                    await self.refresh_stream(interaction.guild.id, player)
                 voice_client.resume()
                 embed = create_embed(
                     title="▶️ Music Resumed",
                     description="Music has been resumed.",
                     color=discord.Color.blue()
                 )
-                await interaction.response.send_message(embed=embed)
+                if interaction.response.is_done():
+                    await interaction.followup.send(embed=embed)
+                else:
+                    await interaction.response.send_message(embed=embed)
             else:
-                embed = create_embed(
-                    title="❌ Not Paused",
-                    description="Music is not currently paused.",
-                    color=discord.Color.red()
-                )
+                embed = template_embed('not_paused')
                 await interaction.response.send_message(embed=embed, ephemeral=True)
         else:
-            embed = create_embed(
-                title="❌ Not Connected",
-                description="I'm not connected to a voice channel.",
-                color=discord.Color.red()
-            )
+            embed = template_embed('not_connected')
             await interaction.response.send_message(embed=embed, ephemeral=True)
 
 async def setup(bot):
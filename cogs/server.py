@@ -1,135 +1,268 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
-import json
 import os
+from utils.cache import TTLCache
+from utils.config_store import get_store
 from utils.embeds import create_embed
+from utils.member_stats import MemberIndex
+
+# Seconds between full recounts that correct drift in the member counters
+MEMBER_RECONCILE_INTERVAL = int(os.getenv('MEMBER_RECONCILE_INTERVAL', 1800))
+
+# Rendered /serverinfo fields are reused until a guild, role, channel or emoji event
+# invalidates them; the TTL only catches changes that send no event
+SERVERINFO_CACHE_SIZE = int(os.getenv('SERVERINFO_CACHE_SIZE', 1000))
+SERVERINFO_CACHE_TTL = 3600
+
+FEATURE_NAMES = {
+    'COMMUNITY': 'Community Server',
+    'WELCOME_SCREEN_ENABLED': 'Welcome Screen',
+    'MEMBER_VERIFICATION_GATE_ENABLED': 'Membership Screening',
+    'PREVIEW_ENABLED': 'Server Preview',
+    'PARTNERED': 'Partnered',
+    'VERIFIED': 'Verified',
+    'DISCOVERABLE': 'Discoverable',
+    'BANNER': 'Banner',
+    'VANITY_URL': 'Vanity URL',
+    'ANIMATED_ICON': 'Animated Icon',
+    'INVITE_SPLASH': 'Invite Splash',
+    'NEWS': 'News Channels',
+    'COMMERCE': 'Commerce',
+    'THREADS_ENABLED': 'Threads Enabled'
+}
+
+VERIFICATION_LEVELS = {
+    discord.VerificationLevel.none: "None",
+    discord.VerificationLevel.low: "Low",
+    discord.VerificationLevel.medium: "Medium",
+    discord.VerificationLevel.high: "High",
+    discord.VerificationLevel.highest: "Highest"
+}
 
 class ServerCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.welcome_dm_store = get_store("welcome_dm_config", legacy_path=os.path.join("data", "welcome_dm_config.json"))
+        self.member_index = MemberIndex()
+        self.info_cache = TTLCache(maxsize=SERVERINFO_CACHE_SIZE, ttl=SERVERINFO_CACHE_TTL)
+
+    async def cog_load(self):
+        self.reconcile_members.start()
+
+    async def cog_unload(self):
+        self.reconcile_members.cancel()
+        await self.welcome_dm_store.flush()
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.member_index.member_join(member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.member_index.member_remove(member)
+
+    @commands.Cog.listener()
+    async def on_presence_update(self, before, after):
+        self.member_index.presence_update(before, after)
+
+    @commands.Cog.listener()
+    async def on_member_cache_evict(self, guild):
+        self.member_index.forget(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.member_index.forget(guild.id)
+        self.info_cache.pop(guild.id)
+
+    @tasks.loop(seconds=MEMBER_RECONCILE_INTERVAL)
+    async def reconcile_members(self):
+        """Recount every guild's members to correct counters that drifted from missed events"""
+        for guild in list(self.bot.guilds):
+            # Guilds without their full member list are counted once they are chunked
+            if guild.chunked:
+                await self.member_index.reconcile(guild)
+
+    @reconcile_members.before_loop
+    async def before_reconcile_members(self):
+        await self.bot.wait_until_ready()
+
+    @commands.Cog.listener()
+    async def on_guild_update(self, before, after):
+        self.info_cache.pop(after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_emojis_update(self, guild, before, after):
+        self.info_cache.pop(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        self.info_cache.pop(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.info_cache.pop(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        self.info_cache.pop(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        self.info_cache.pop(channel.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.info_cache.pop(channel.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        self.info_cache.pop(after.guild.id)
+
+    async def member_stats(self, interaction):
+        """Return the member counters of the interaction's guild, chunking its members first if needed"""
+        guild = interaction.guild
+        member_cache = self.bot.member_cache
+        if not member_cache.is_cached(guild):
+            # Chunking a large guild can take longer than the 3 seconds an interaction allows
+            await interaction.response.defer()
+        try:
+            await member_cache.ensure(guild)
+        except Exception as e:
+            print(f"Failed to chunk members of {guild.name}: {e}")
+            return self.member_index.count(guild.members)
+        return self.member_index.get(guild)
+
+    async def send(self, interaction, embed):
+        if interaction.response.is_done():
+            await interaction.followup.send(embed=embed)
+        else:
+            await interaction.response.send_message(embed=embed)
+
+    def stats(self):
+        """Return server info cache and member index counters for monitoring"""
+        return {
+            'serverinfo_cache': self.info_cache.stats(),
+            'member_index': {
+                'guilds': len(self.member_index.guilds),
+                'reconciles': self.member_index.reconciles,
+                'drift': self.member_index.drift
+            }
+        }
+
+    def server_info(self, guild):
+        """Return the rendered server info fields of a guild, rebuilding them only after it changed"""
+        info = self.info_cache.get(guild.id)
+        if info is not None:
+            return info
+
+        fields = []
+        fields.append((
+            "📊 Basic Info",
+            f"**Owner:** {guild.owner.mention if guild.owner else 'Unknown'}\n"
+            f"**Created:** {guild.created_at.strftime('%B %d, %Y')}\n"
+            f"**Server ID:** {guild.id}\n"
+            f"**Region:** {guild.preferred_locale}",
+            True
+        ))
+        # Member counts change constantly, they are filled in per request
+        fields.append(None)
+        text_channels = len(guild.text_channels)
+        voice_channels = len(guild.voice_channels)
+        categories = len(guild.categories)
+        fields.append((
+            "📝 Channels",
+            f"**Text:** {text_channels}\n"
+            f"**Voice:** {voice_channels}\n"
+            f"**Categories:** {categories}\n"
+            f"**Total:** {text_channels + voice_channels}",
+            True
+        ))
+        feature_list = [FEATURE_NAMES[feature] for feature in guild.features if feature in FEATURE_NAMES]
+        if feature_list:
+            fields.append((
+                "✨ Features",
+                "\n".join(f"• {feature}" for feature in feature_list[:10]),
+                False
+            ))
+        fields.append((
+            "🚀 Nitro Boost",
+            f"**Level:** {guild.premium_tier}/3\n"
+            f"**Boosts:** {guild.premium_subscription_count}",
+            True
+        ))
+        role_count = len(guild.roles) - 1
+        fields.append((
+            "🎭 Roles",
+            f"**Total:** {role_count}\n"
+            f"**Highest:** {guild.roles[-1].mention if len(guild.roles) > 1 else '@everyone'}",
+            True
+        ))
+        animated_emojis = sum(1 for emoji in guild.emojis if emoji.animated)
+        fields.append((
+            "😀 Emojis",
+            f"**Total:** {len(guild.emojis)}\n"
+            f"**Static:** {len(guild.emojis) - animated_emojis}\n"
+            f"**Animated:** {animated_emojis}",
+            True
+        ))
+        fields.append((
+            "🔒 Security",
+            f"**Verification:** {VERIFICATION_LEVELS.get(guild.verification_level, 'Unknown')}\n"
+            f"**2FA Required:** {'Yes' if guild.mfa_level else 'No'}\n"
+            f"**Explicit Filter:** {guild.explicit_content_filter.name.title()}",
+            False
+        ))
+
+        info = {
+            'title': f"🏛️ {guild.name} Server Information",
+            'thumbnail': guild.icon.url if guild.icon else None,
+            'image': guild.banner.url if guild.banner else None,
+            'fields': fields
+        }
+        self.info_cache.set(guild.id, info)
+        return info
 
     @app_commands.command(name="serverinfo", description="Display server information")
     async def serverinfo(self, interaction: discord.Interaction):
         guild = interaction.guild
+        stats = await self.member_stats(interaction)
+        info = self.server_info(guild)
         embed = create_embed(
-            title=f"🏛️ {guild.name} Server Information",
+            title=info['title'],
             color=discord.Color.blue()
         )
-        if guild.icon:
-            embed.set_thumbnail(url=guild.icon.url)
-        embed.add_field(
-            name="📊 Basic Info",
-            value=f"**Owner:** {guild.owner.mention if guild.owner else 'Unknown'}\n"
-                  f"**Created:** {guild.created_at.strftime('%B %d, %Y')}\n"
-                  f"**Server ID:** {guild.id}\n"
-                  f"**Region:** {guild.preferred_locale}",
-            inline=True
-        )
+        if info['thumbnail']:
+            embed.set_thumbnail(url=info['thumbnail'])
         total_members = guild.member_count
-        online_members = sum(1 for member in guild.members if member.status != discord.Status.offline)
-        bots = sum(1 for member in guild.members if member.bot)
-        humans = total_members - bots
-        embed.add_field(
-            name="👥 Members",
-            value=f"**Total:** {total_members}\n"
-                  f"**Humans:** {humans}\n"
-                  f"**Bots:** {bots}\n"
-                  f"**Online:** {online_members}",
-            inline=True
-        )
-        text_channels = len(guild.text_channels)
-        voice_channels = len(guild.voice_channels)
-        categories = len(guild.categories)
-        embed.add_field(
-            name="📝 Channels",
-            value=f"**Text:** {text_channels}\n"
-                  f"**Voice:** {voice_channels}\n"
-                  f"**Categories:** {categories}\n"
-                  f"**Total:** {text_channels + voice_channels}",
-            inline=True
-        )
-        features = guild.features
-        if features:
-            feature_list = []
-            feature_names = {
-                'COMMUNITY': 'Community Server',
-                'WELCOME_SCREEN_ENABLED': 'Welcome Screen',
-                'MEMBER_VERIFICATION_GATE_ENABLED': 'Membership Screening',
-                'PREVIEW_ENABLED': 'Server Preview',
-                'PARTNERED': 'Partnered',
-                'VERIFIED': 'Verified',
-                'DISCOVERABLE': 'Discoverable',
-                'BANNER': 'Banner',
-                'VANITY_URL': 'Vanity URL',
-                'ANIMATED_ICON': 'Animated Icon',
-                'INVITE_SPLASH': 'Invite Splash',
-                'NEWS': 'News Channels',
-                'COMMERCE': 'Commerce',
-                'THREADS_ENABLED': 'Threads Enabled'
-            }
-            for feature in features:
-                if feature in feature_names:
-                    feature_list.append(feature_names[feature])
-            if feature_list:
+        for field in info['fields']:
+            if field is None:
                 embed.add_field(
-                    name="✨ Features",
-                    value="\n".join(f"• {feature}" for feature in feature_list[:10]),
-                    inline=False
+                    name="👥 Members",
+                    value=f"**Total:** {total_members}\n"
+                          f"**Humans:** {total_members - stats.bots}\n"
+                          f"**Bots:** {stats.bots}\n"
+                          f"**Online:** {stats.online}",
+                    inline=True
                 )
-        boost_level = guild.premium_tier
-        boost_count = guild.premium_subscription_count
-        embed.add_field(
-            name="🚀 Nitro Boost",
-            value=f"**Level:** {boost_level}/3\n"
-                  f"**Boosts:** {boost_count}",
-            inline=True
-        )
-        role_count = len(guild.roles) - 1
-        embed.add_field(
-            name="🎭 Roles",
-            value=f"**Total:** {role_count}\n"
-                  f"**Highest:** {guild.roles[-1].mention if len(guild.roles) > 1 else '@everyone'}",
-            inline=True
-        )
-        emoji_count = len(guild.emojis)
-        static_emojis = sum(1 for emoji in guild.emojis if not emoji.animated)
-        animated_emojis = sum(1 for emoji in guild.emojis if emoji.animated)
-        embed.add_field(
-            name="😀 Emojis",
-            value=f"**Total:** {emoji_count}\n"
-                  f"**Static:** {static_emojis}\n"
-                  f"**Animated:** {animated_emojis}",
-            inline=True
-        )
-        verification_levels = {
-            discord.VerificationLevel.none: "None",
-            discord.VerificationLevel.low: "Low",
-            discord.VerificationLevel.medium: "Medium",
-            discord.VerificationLevel.high: "High",
-            discord.VerificationLevel.highest: "Highest"
-        }
-        embed.add_field(
-            name="🔒 Security",
-            value=f"**Verification:** {verification_levels.get(guild.verification_level, 'Unknown')}\n"
-                  f"**2FA Required:** {'Yes' if guild.mfa_level else 'No'}\n"
-                  f"**Explicit Filter:** {guild.explicit_content_filter.name.title()}",
-            inline=False
-        )
+            else:
+                name, value, inline = field
+                embed.add_field(name=name, value=value, inline=inline)
         embed.set_footer(
             text=f"Requested by {interaction.user.display_name}",
             icon_url=interaction.user.display_avatar.url
         )
-        if guild.banner:
-            embed.set_image(url=guild.banner.url)
-        await interaction.response.send_message(embed=embed)
+        if info['image']:
+            embed.set_image(url=info['image'])
+        await self.send(interaction, embed)
 
     @app_commands.command(name="membercount", description="Show current member count")
     async def membercount(self, interaction: discord.Interaction):
         guild = interaction.guild
+        stats = await self.member_stats(interaction)
         total_members = guild.member_count
-        online_members = sum(1 for member in guild.members if member.status != discord.Status.offline)
-        bots = sum(1 for member in guild.members if member.bot)
+        online_members = stats.online
+        bots = stats.bots
         humans = total_members - bots
         embed = create_embed(
             title=f"👥 {guild.name} Member Count",
@@ -142,7 +275,7 @@ class ServerCog(commands.Cog):
         embed.add_field(name="Offline", value=total_members - online_members, inline=True)
         if guild.icon:
             embed.set_thumbnail(url=guild.icon.url)
-        await interaction.response.send_message(embed=embed)
+        await self.send(interaction, embed)
 
     @app_commands.command(name="set_welcomedm", description="Set custom welcome DM message (Admin only)")
     @app_commands.describe(message="Custom welcome message", image_url="Optional image URL to include")
@@ -150,19 +283,8 @@ class ServerCog(commands.Cog):
         if not interaction.user.guild_permissions.administrator:
             await interaction.response.send_message("❌ You must be an administrator to use this command.", ephemeral=True)
             return
-        guild_id = str(interaction.guild.id)
         welcome_data = {"message": message, "image_url": image_url}
-        if not os.path.exists("data"):
-            os.makedirs("data")
-        config_path = os.path.join("data", "welcome_dm_config.json")
-        try:
-            with open(config_path, "r") as f:
-                data = json.load(f)
-        except FileNotFoundError:
-            data = {}
-        data[guild_id] = welcome_data
-        with open(config_path, "w") as f:
-            json.dump(data, f, indent=4)
+        self.welcome_dm_store.set(interaction.guild.id, welcome_data)
         await interaction.response.send_message("✅ Welcome DM message set successfully!", ephemeral=True)
 
 async def setup(bot):
@@ -2,7 +2,7 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from utils.checks import is_admin
-from utils.embeds import create_embed
+from utils.embeds import create_embed, template_embed
 
 class VoiceCog(commands.Cog):
     def __init__(self, bot):
@@ -15,11 +15,7 @@ class VoiceCog(commands.Cog):
         
         # Check if user has administrator permissions
         if not interaction.user.guild_permissions.administrator:
-            embed = create_embed(
-                title="❌ Permission Denied",
-                description="You need Administrator permissions to use this command.",
-                color=discord.Color.red()
-            )
+            embed = template_embed('permission_denied')
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
@@ -1,28 +1,174 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import json
+import asyncio
 import os
-from utils.embeds import create_embed
+import time
+from collections import deque
+from utils.config_store import get_store
+from utils.embeds import create_embed, template_embed
+from utils.templates import TemplateError, VARIABLE_HELP, compile_template, load_template
+
+# More joins (or leaves) than BATCH_THRESHOLD within BATCH_WINDOW seconds switch a
+# guild to one summary message every BATCH_FLUSH_INTERVAL seconds
+BATCH_THRESHOLD = int(os.getenv('WELCOME_BATCH_THRESHOLD', 5))
+BATCH_WINDOW = 10
+BATCH_FLUSH_INTERVAL = 5
+# Members kept per summary; anything beyond is only counted
+BATCH_MAX_PENDING = 1000
+BATCH_MAX_LISTED = 50
+
+class AnnouncementBatch:
+    """Per-guild join or leave announcements, merged into summaries during floods"""
+
+    def __init__(self):
+        self.recent = deque()
+        self.members = []
+        self.overflow = 0
+        self.task = None
+
+    def rate(self, now):
+        """Number of events within the batching window"""
+        while self.recent and now - self.recent[0] > BATCH_WINDOW:
+            self.recent.popleft()
+        return len(self.recent)
+
+    def record(self, now):
+        """Record an event and return whether the guild is being flooded"""
+        self.recent.append(now)
+        return self.rate(now) > BATCH_THRESHOLD
+
+    def add(self, member):
+        if len(self.members) < BATCH_MAX_PENDING:
+            self.members.append(member)
+        else:
+            self.overflow += 1
+
+    def take(self):
+        members, overflow = self.members, self.overflow
+        self.members, self.overflow = [], 0
+        return members, overflow
+
+class DepartedUser:
+    """User who left a guild without being in the member cache, with the guild the templates read"""
+
+    def __init__(self, user, guild):
+        self._user = user
+        self.guild = guild
+        # Only cached members know when they joined
+        self.joined_at = None
+
+    def __getattr__(self, name):
+        return getattr(self._user, name)
+
+    def __str__(self):
+        return str(self._user)
 
 class WelcomeCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.store = get_store('welcome_messages', legacy_path=os.path.join('data', 'welcome_messages.json'))
         self.welcome_data = self.load_welcome_data()
+        self.batches = {}
+        # Compiled templates keyed by (guild_id, kind), filled on first use or when saved
+        self.templates = {}
+
+    async def cog_unload(self):
+        for batch in self.batches.values():
+            if batch.task:
+                batch.task.cancel()
+        await self.store.flush()
 
     def load_welcome_data(self):
-        """Load welcome messages from JSON file"""
+        """Return the shared in-memory welcome config"""
+        return self.store.data
+
+    def save_welcome_data(self, guild_id):
+        """Schedule a write of one guild's welcome config off the event loop"""
+        self.store.save(guild_id)
+
+    def get_template(self, guild_id, kind, default):
+        """Return the compiled welcome or goodbye template of a guild"""
+        source = self.welcome_data[guild_id].get(f'{kind}_message', default)
+        template = self.templates.get((guild_id, kind))
+        if template is None or template.source != source:
+            template = self.templates[(guild_id, kind)] = load_template(source)
+        return template
+
+    def template_error_embed(self, error):
+        """Create the embed explaining why a template was rejected"""
+        return create_embed(
+            title="❌ Invalid Template",
+            description=f"{error}\n\n**Available Variables**\n{VARIABLE_HELP}",
+            color=discord.Color.red()
+        )
+
+    def batch_member(self, member, kind):
+        """Queue a member for a summary message if the guild is flooded, return whether it was queued"""
+        key = (member.guild.id, kind)
+        batch = self.batches.get(key)
+        if batch is None:
+            batch = self.batches[key] = AnnouncementBatch()
+
+        flooded = batch.record(time.monotonic())
+        if not flooded and batch.task is None:
+            return False
+
+        batch.add(member)
+        if batch.task is None:
+            batch.task = self.bot.loop.create_task(self.flush_batches(member.guild, kind, batch))
+        return True
+
+    async def flush_batches(self, guild, kind, batch):
+        """Send queued members as one summary per interval until the flood is over"""
         try:
-            with open('data/welcome_messages.json', 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
+            while True:
+                await asyncio.sleep(BATCH_FLUSH_INTERVAL)
+                members, overflow = batch.take()
+                if not members and not overflow:
+                    if batch.rate(time.monotonic()) <= BATCH_THRESHOLD:
+                        return
+                    continue
+
+                config = self.welcome_data.get(str(guild.id), {})
+                channel = self.bot.get_channel(config.get('channel_id')) if config.get('enabled', False) else None
+                if not channel:
+                    continue
+
+                # Sends are awaited one at a time, so a rate limited channel slows the
+                # flushes down instead of piling up requests
+                try:
+                    await channel.send(embed=self.batch_embed(guild, kind, config, members, overflow))
+                except discord.HTTPException as e:
+                    print(f'Failed to send {kind} summary in {guild.id}: {e}')
+        finally:
+            batch.task = None
+
+    def batch_embed(self, guild, kind, config, members, overflow):
+        """Create a summary embed for a batch of joined or departed members"""
+        total = len(members) + overflow
+        if kind == 'welcome':
+            names = [member.mention for member in members[:BATCH_MAX_LISTED]]
+            embed = create_embed(
+                title="👋 Welcome!",
+                description=f"**{total}** new members joined {guild.name}!\n" + ", ".join(names),
+                color=discord.Color.green()
+            )
+            embed.set_footer(text=f"Member #{guild.member_count}")
+        else:
+            names = [str(member) for member in members[:BATCH_MAX_LISTED]]
+            embed = create_embed(
+                title="👋 Goodbye!",
+                description=f"**{total}** members left {guild.name}.\n" + ", ".join(names),
+                color=discord.Color.orange()
+            )
+            embed.set_footer(text=f"We now have {guild.member_count} members")
 
-    def save_welcome_data(self):
-        """Save welcome messages to JSON file"""
-        os.makedirs('data', exist_ok=True)
-        with open('data/welcome_messages.json', 'w') as f:
-            json.dump(self.welcome_data, f, indent=2)
+        if total > len(names):
+            embed.description += f" and {total - len(names)} more"
+        if config.get(f'{kind}_image'):
+            embed.set_image(url=config[f'{kind}_image'])
+        return embed
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
@@ -32,11 +178,9 @@ class WelcomeCog(commands.Cog):
             channel_id = self.welcome_data[guild_id].get('channel_id')
             if channel_id:
                 channel = self.bot.get_channel(channel_id)
-                if channel:
-                    welcome_msg = self.welcome_data[guild_id].get('welcome_message', 'Welcome {user} to {server}!')
-                    welcome_msg = welcome_msg.replace('{user}', member.mention)
-                    welcome_msg = welcome_msg.replace('{server}', member.guild.name)
-                    welcome_msg = welcome_msg.replace('{member_count}', str(member.guild.member_count))
+                if channel and not self.batch_member(member, 'welcome'):
+                    template = self.get_template(guild_id, 'welcome', 'Welcome {user} to {server}!')
+                    welcome_msg = template.render(member)
 
                     embed = create_embed(
                         title="👋 Welcome!",
@@ -52,18 +196,23 @@ class WelcomeCog(commands.Cog):
                     await channel.send(embed=embed)
 
     @commands.Cog.listener()
-    async def on_member_remove(self, member):
-        """Handle member leave events"""
-        guild_id = str(member.guild.id)
+    async def on_raw_member_remove(self, payload):
+        """Handle member leave events, also for members that were never cached"""
+        guild = self.bot.get_guild(payload.guild_id)
+        if guild is None:
+            return
+        member = payload.user
+        if not isinstance(member, discord.Member):
+            member = DepartedUser(member, guild)
+
+        guild_id = str(guild.id)
         if guild_id in self.welcome_data and self.welcome_data[guild_id].get('enabled', False):
             channel_id = self.welcome_data[guild_id].get('channel_id')
             if channel_id:
                 channel = self.bot.get_channel(channel_id)
-                if channel:
-                    goodbye_msg = self.welcome_data[guild_id].get('goodbye_message', 'Goodbye {user}!')
-                    goodbye_msg = goodbye_msg.replace('{user}', str(member))
-                    goodbye_msg = goodbye_msg.replace('{server}', member.guild.name)
-                    goodbye_msg = goodbye_msg.replace('{member_count}', str(member.guild.member_count))
+                if channel and not self.batch_member(member, 'goodbye'):
+                    template = self.get_template(guild_id, 'goodbye', 'Goodbye {user}!')
+                    goodbye_msg = template.render(member, user=str(member))
 
                     embed = create_embed(
                         title="👋 Goodbye!",
@@ -84,11 +233,7 @@ class WelcomeCog(commands.Cog):
         
         # Check if user has administrator permissions
         if not interaction.user.guild_permissions.administrator:
-            embed = create_embed(
-                title="❌ Permission Denied",
-                description="You need Administrator permissions to use this command.",
-                color=discord.Color.red()
-            )
+            embed = template_embed('permission_denied')
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
@@ -130,7 +275,7 @@ class WelcomeCog(commands.Cog):
         
         embed.add_field(
             name="Available Variables",
-            value="`{user}` - User mention\n`{server}` - Server name\n`{member_count}` - Member count",
+            value=VARIABLE_HELP,
             inline=False
         )
 
@@ -139,7 +284,7 @@ class WelcomeCog(commands.Cog):
     @app_commands.command(name="setwelcome", description="Set welcome message and channel (Administrator only)")
     @app_commands.describe(
         channel="Channel for welcome messages",
-        message="Welcome message (use {user}, {server}, {member_count})",
+        message="Welcome message (use {user}, {server}, {member_count}, {member_number}, ...)",
         image_url="Optional image URL for welcome messages"
     )
     async def set_welcome(self, interaction: discord.Interaction, channel: discord.TextChannel, message: str, image_url: str = None):
@@ -147,14 +292,17 @@ class WelcomeCog(commands.Cog):
         
         # Check if user has administrator permissions
         if not interaction.user.guild_permissions.administrator:
-            embed = create_embed(
-                title="❌ Permission Denied",
-                description="You need Administrator permissions to use this command.",
-                color=discord.Color.red()
-            )
+            embed = template_embed('permission_denied')
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
+        # Reject bad templates now instead of failing on the next join
+        try:
+            template = compile_template(message)
+        except TemplateError as e:
+            await interaction.response.send_message(embed=self.template_error_embed(e), ephemeral=True)
+            return
+
         guild_id = str(interaction.guild.id)
         
         if guild_id not in self.welcome_data:
@@ -163,11 +311,12 @@ class WelcomeCog(commands.Cog):
         self.welcome_data[guild_id]['enabled'] = True
         self.welcome_data[guild_id]['channel_id'] = channel.id
         self.welcome_data[guild_id]['welcome_message'] = message
+        self.templates[(guild_id, 'welcome')] = template
         
         if image_url:
             self.welcome_data[guild_id]['welcome_image'] = image_url
         
-        self.save_welcome_data()
+        self.save_welcome_data(guild_id)
         
         embed = create_embed(
             title="✅ Welcome Message Configured",
@@ -182,7 +331,7 @@ class WelcomeCog(commands.Cog):
 
     @app_commands.command(name="setgoodbye", description="Set goodbye message (Administrator only)")
     @app_commands.describe(
-        message="Goodbye message (use {user}, {server}, {member_count})",
+        message="Goodbye message (use {user}, {server}, {member_count}, ...)",
         image_url="Optional image URL for goodbye messages"
     )
     async def set_goodbye(self, interaction: discord.Interaction, message: str, image_url: str = None):
@@ -190,14 +339,16 @@ class WelcomeCog(commands.Cog):
         
         # Check if user has administrator permissions
         if not interaction.user.guild_permissions.administrator:
-            embed = create_embed(
-                title="❌ Permission Denied",
-                description="You need Administrator permissions to use this command.",
-                color=discord.Color.red()
-            )
+            embed = template_embed('permission_denied')
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
+        try:
+            template = compile_template(message)
+        except TemplateError as e:
+            await interaction.response.send_message(embed=self.template_error_embed(e), ephemeral=True)
+            return
+
         guild_id = str(interaction.guild.id)
         
         if guild_id not in self.welcome_data:
@@ -210,11 +361,12 @@ class WelcomeCog(commands.Cog):
             return
         
         self.welcome_data[guild_id]['goodbye_message'] = message
+        self.templates[(guild_id, 'goodbye')] = template
         
         if image_url:
             self.welcome_data[guild_id]['goodbye_image'] = image_url
         
-        self.save_welcome_data()
+        self.save_welcome_data(guild_id)
         
         embed = create_embed(
             title="✅ Goodbye Message Configured",
@@ -233,11 +385,7 @@ class WelcomeCog(commands.Cog):
         
         # Check if user has administrator permissions
         if not interaction.user.guild_permissions.administrator:
-            embed = create_embed(
-                title="❌ Permission Denied",
-                description="You need Administrator permissions to use this command.",
-                color=discord.Color.red()
-            )
+            embed = template_embed('permission_denied')
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
@@ -247,7 +395,7 @@ class WelcomeCog(commands.Cog):
             self.welcome_data[guild_id] = {'enabled': False}
         
         self.welcome_data[guild_id]['enabled'] = not self.welcome_data[guild_id].get('enabled', False)
-        self.save_welcome_data()
+        self.save_welcome_data(guild_id)
         
         status = "enabled" if self.welcome_data[guild_id]['enabled'] else "disabled"
         color = discord.Color.green() if self.welcome_data[guild_id]['enabled'] else discord.Color.red()
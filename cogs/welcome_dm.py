@@ -1,37 +1,36 @@
-import discord
-from discord.ext import commands
-import json
-import os
-
-class WelcomeDMCog(commands.Cog):
-    def __init__(self, bot):
-        self.bot = bot
-
-    @commands.Cog.listener()
-    async def on_member_join(self, member):
-        config_path = os.path.join("data", "welcome_dm_config.json")
-
-        try:
-            with open(config_path, "r", encoding="utf-8") as f:  # Tambah encoding utf-8
-                    data = json.load(f)
-
-        except FileNotFoundError:
-            data = {}
-
-        guild_id = str(member.guild.id)
-        if guild_id in data:
-            config = data[guild_id]
-            message = config.get("message", "Welcome to the server!")
-            image_url = config.get("image_url")
-
-            embed = discord.Embed(description=message, color=discord.Color.green())
-            if image_url:
-                embed.set_image(url=image_url)
-
-            try:
-                await member.send(embed=embed)
-            except discord.Forbidden:
-                print(f"Cannot send DM to {member.name}")
-
-async def setup(bot):
-    await bot.add_cog(WelcomeDMCog(bot))
+import discord
+from discord.ext import commands
+import os
+from utils.config_store import get_store
+from utils.dm_dispatcher import DMDispatcher
+
+class WelcomeDMCog(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.store = get_store("welcome_dm_config", legacy_path=os.path.join("data", "welcome_dm_config.json"))
+        self.dispatcher = DMDispatcher()
+
+    async def cog_load(self):
+        self.dispatcher.start()
+
+    async def cog_unload(self):
+        self.dispatcher.stop()
+        await self.store.flush()
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        config = self.store.get(member.guild.id)
+        if config is not None:
+            message = config.get("message", "Welcome to the server!")
+            image_url = config.get("image_url")
+
+            embed = discord.Embed(description=message, color=discord.Color.green())
+            if image_url:
+                embed.set_image(url=image_url)
+
+            # Sent in the background so join floods don't compete with command responses;
+            # members with closed DMs or a full queue are counted in dispatcher.stats()
+            self.dispatcher.submit(member, embed=embed)
+
+async def setup(bot):
+    await bot.add_cog(WelcomeDMCog(bot))
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import signal
+import sys
+import time
+import aiohttp
+from dotenv import load_dotenv
+
+# Load .env file (untuk lokal development)
+load_dotenv()
+
+from utils.sharding import SHARD_COUNT, format_shard_ids, shard_ranges
+
+# Worker processes to spread the shards over, each runs main.py with AutoShardedBot
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', 1))
+# The audio cache is split between the workers, see Worker.environment()
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR')
+AUDIO_CACHE_MAX_BYTES = int(os.getenv('AUDIO_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+# Discord allows one IDENTIFY per 5 seconds per max_concurrency bucket across all processes
+IDENTIFY_INTERVAL = 5
+RESTART_DELAY = 5
+RESTART_DELAY_MAX = 300
+# A worker that ran this long before exiting restarts without backoff
+STABLE_RUNTIME = 60
+
+GATEWAY_URL = 'https://discord.com/api/v10/gateway/bot'
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+async def fetch_gateway(token):
+    """Recommended shard count and identify concurrency for the bot"""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_URL, headers={'Authorization': f'Bot {token}'}) as response:
+            response.raise_for_status()
+            data = await response.json()
+    return data['shards'], data.get('session_start_limit', {}).get('max_concurrency', 1)
+
+class Worker:
+    """One main.py process running a range of shards, restarted when it exits"""
+
+    def __init__(self, index, shard_ids, shard_count, start_delay, worker_count=1):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.start_delay = start_delay
+        self.worker_count = worker_count
+        self.process = None
+        self.stopping = asyncio.Event()
+
+    async def sleep(self, delay):
+        """Sleep unless the worker is stopped first"""
+        try:
+            await asyncio.wait_for(self.stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def environment(self):
+        env = dict(os.environ)
+        env['SHARD_COUNT'] = str(self.shard_count)
+        env['SHARD_IDS'] = format_shard_ids(self.shard_ids)
+        if os.getenv('METRICS_PORT'):
+            # Every worker serves its own metrics on the next port
+            env['METRICS_PORT'] = str(int(os.getenv('METRICS_PORT')) + self.index)
+        if AUDIO_CACHE_DIR:
+            # The cache tracks its size in memory and clears leftover .part files on start,
+            # so each worker gets its own directory and an equal share of the byte budget
+            env['AUDIO_CACHE_DIR'] = os.path.join(AUDIO_CACHE_DIR, f'worker-{self.index}')
+            env['AUDIO_CACHE_MAX_BYTES'] = str(AUDIO_CACHE_MAX_BYTES // self.worker_count)
+        return env
+
+    async def run(self):
+        await self.sleep(self.start_delay)
+        delay = RESTART_DELAY
+        while not self.stopping.is_set():
+            env = self.environment()
+            print(f'Starting worker {self.index} with shards {env["SHARD_IDS"]} of {self.shard_count}')
+            started = time.monotonic()
+            self.process = await asyncio.create_subprocess_exec(sys.executable, MAIN, env=env)
+            code = await self.process.wait()
+            if self.stopping.is_set():
+                break
+            if time.monotonic() - started >= STABLE_RUNTIME:
+                delay = RESTART_DELAY
+            print(f'Worker {self.index} exited with code {code}, restarting in {delay}s')
+            await self.sleep(delay)
+            delay = min(RESTART_DELAY_MAX, delay * 2)
+
+    def stop(self):
+        self.stopping.set()
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+
+async def main():
+    TOKEN = os.getenv("TOKEN")
+    if not TOKEN:
+        print("TOKEN tidak ditemukan di environment variables!")
+        return
+
+    shard_count = SHARD_COUNT
+    max_concurrency = 1
+    if SHARD_COUNT is None or SHARD_WORKERS > 1:
+        recommended, max_concurrency = await fetch_gateway(TOKEN)
+        shard_count = shard_count or recommended
+
+    workers = []
+    start_delay = 0
+    ranges = shard_ranges(shard_count, SHARD_WORKERS)
+    for index, shard_ids in enumerate(ranges):
+        workers.append(Worker(index, shard_ids, shard_count, start_delay, len(ranges)))
+        # Stagger workers so their IDENTIFYs don't compete for the same rate limit
+        start_delay += IDENTIFY_INTERVAL * -(-len(shard_ids) // max_concurrency)
+    print(f'Running {shard_count} shard(s) in {len(workers)} worker process(es)')
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: [worker.stop() for worker in workers])
+
+    await asyncio.gather(*(worker.run() for worker in workers))
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,13 +1,26 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import asyncio
 import os
+import signal
 from dotenv import load_dotenv  # Pastikan python-dotenv ada
 import logging
+import time
 
 # Load .env file (untuk lokal development)
 load_dotenv()
 
+# Imported after load_dotenv so its settings can come from .env
+from utils.member_cache import MemberCache, MEMBER_CHUNK_AT_STARTUP
+from utils.command_sync import sync_commands
+from utils.sharding import SHARDED, bot_options, runs_shard_zero, shard_stats
+from utils.metrics import METRICS_PORT, MetricsCommandTree, MetricsServer
+from utils.stall_detector import LOOP_STALL_THRESHOLD, StallDetector
+from utils import runtime
+
+# Seconds between per-shard latency reports when sharded
+SHARD_REPORT_INTERVAL = int(os.getenv('SHARD_REPORT_INTERVAL', 300))
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
@@ -17,33 +30,84 @@ intents.message_content = True
 intents.voice_states = True
 intents.guilds = True
 intents.members = True
+# Privileged like members; without it every member looks offline and the online counts
+# of /serverinfo and /membercount stay at 0
+intents.presences = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Created by create_bot(). The extractor's worker processes re-import this module,
+# so nothing is built at import time
+bot = None
+commands_synced = False
+
+def create_bot():
+    """Build the bot and register its event handlers"""
+    global bot
+    # Member lists are requested per guild when a command needs them (see utils/member_cache.py).
+    # With SHARDED/SHARD_COUNT set this process runs its shards with AutoShardedBot (see launcher.py)
+    bot_class = commands.AutoShardedBot if SHARDED else commands.Bot
+    bot = bot_class(
+        command_prefix='!',
+        intents=intents,
+        chunk_guilds_at_startup=MEMBER_CHUNK_AT_STARTUP,
+        member_cache_flags=discord.MemberCacheFlags.from_intents(intents),
+        tree_cls=MetricsCommandTree,
+        **bot_options()
+    )
+    bot.member_cache = MemberCache(bot)
+    bot.stall_detector = StallDetector() if LOOP_STALL_THRESHOLD else None
+    for event in (on_ready, on_shard_ready, on_member_join, on_member_remove):
+        bot.event(event)
+    return bot
 
-@bot.event
 async def on_ready():
     print(f'{bot.user} has connected to Discord!')
     print(f'Bot is in {len(bot.guilds)} guilds')
+    if SHARDED:
+        print_shard_report()
     
+    # on_ready fires again after every reconnect; the tree only needs syncing once per process.
+    # When sharded across processes only the one running shard 0 syncs
+    global commands_synced
+    if commands_synced or not runs_shard_zero(bot):
+        return
+
     # Sync slash commands
     try:
-        synced = await bot.tree.sync()
-        print(f'Synced {len(synced)} command(s)')
+        synced = await sync_commands(bot)
+        commands_synced = True
+        if synced is None:
+            print('Command tree unchanged, skipped sync')
+        else:
+            print(f'Synced {synced} command(s)')
     except Exception as e:
         print(f'Failed to sync commands: {e}')
 
-@bot.event
+async def on_shard_ready(shard_id):
+    guilds = sum(1 for guild in bot.guilds if guild.shard_id == shard_id)
+    print(f'Shard {shard_id} ready with {guilds} guilds')
+
+def print_shard_report():
+    for shard in shard_stats(bot):
+        print(f"Shard {shard['shard_id']}: {shard['latency'] * 1000:.0f} ms latency, {shard['guilds']} guilds")
+
+@tasks.loop(seconds=SHARD_REPORT_INTERVAL)
+async def report_shards():
+    print_shard_report()
+
+@report_shards.before_loop
+async def before_report_shards():
+    await bot.wait_until_ready()
+
 async def on_member_join(member):
     """Handle member join events for welcome messages"""
     pass
 
-@bot.event
 async def on_member_remove(member):
     """Handle member leave events for goodbye messages"""
     pass
 
 async def load_cogs():
-    """Load all cogs"""
+    """Load all cogs and report how long each one took"""
     cogs = [
         'cogs.voice',
         'cogs.music',
@@ -52,22 +116,47 @@ async def load_cogs():
         'cogs.welcome_dm',
         'cogs.server'
     ]
-    
+
+    start = time.perf_counter()
     for cog in cogs:
+        cog_start = time.perf_counter()
         try:
             await bot.load_extension(cog)
-            print(f'Loaded {cog}')
         except Exception as e:
             print(f'Failed to load {cog}: {e}')
+            continue
+        print(f'Loaded {cog} in {(time.perf_counter() - cog_start) * 1000:.0f} ms')
+    print(f'Loaded cogs in {(time.perf_counter() - start) * 1000:.0f} ms')
 
 async def main():
-    await load_cogs()
     TOKEN = os.getenv("TOKEN")
     if not TOKEN:
         print("TOKEN tidak ditemukan di environment variables!")
         return
+    create_bot()
+    connector = runtime.make_connector()
+    if connector is not None:
+        bot.http.connector = connector
+    print(runtime.banner(connector))
+
     async with bot:
+        # launcher.py and the platform stop the bot with SIGTERM; closing the bot unloads
+        # the cogs, which flushes pending config writes and shuts down the extractor pool
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(bot.close()))
+        except NotImplementedError:
+            # Not supported on Windows
+            pass
+        # Inside the context manager so the cogs' background loops can wait for the bot to be ready
+        await load_cogs()
+        bot.member_cache.start()
+        if SHARDED:
+            report_shards.start()
+        if bot.stall_detector is not None:
+            bot.stall_detector.start()
+        if METRICS_PORT:
+            await MetricsServer(bot).start()
         await bot.start(TOKEN)
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    runtime.run(main())
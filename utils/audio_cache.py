@@ -0,0 +1,178 @@
+import asyncio
+import os
+import re
+from collections import OrderedDict
+from utils.cache import TTLCache
+
+# Audio cache configuration; the cache is disabled unless a directory is set.
+# A directory belongs to one process: launcher.py gives each worker its own
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR')
+AUDIO_CACHE_MAX_BYTES = int(os.getenv('AUDIO_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv('AUDIO_CACHE_MIN_PLAYS', 2))
+AUDIO_CACHE_MAX_DURATION = int(os.getenv('AUDIO_CACHE_MAX_DURATION', 900))
+AUDIO_CACHE_TRANSCODES = int(os.getenv('AUDIO_CACHE_TRANSCODES', 2))
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+class AudioCache:
+    """Size-bounded directory of Opus files for frequently played tracks"""
+
+    def __init__(self, directory, max_bytes=AUDIO_CACHE_MAX_BYTES, min_plays=AUDIO_CACHE_MIN_PLAYS,
+                 max_duration=AUDIO_CACHE_MAX_DURATION, transcodes=AUDIO_CACHE_TRANSCODES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.max_duration = max_duration
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.files = OrderedDict()
+        self.plays = TTLCache(maxsize=4096, ttl=86400)
+        self._pending = set()
+        # Filesystem calls running in threads so they stay off the event loop
+        self._io_tasks = set()
+        self._transcodes = transcodes
+        self._semaphore = None
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """Index files left by a previous run, least recently used first"""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.part'):
+                os.remove(path)
+            elif name.endswith('.opus'):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name[:-len('.opus')], stat.st_size))
+        for _, name, size in sorted(entries):
+            self.files[name] = size
+            self.total_bytes += size
+        # Runs once at startup, before the bot serves any commands
+        remove_files(self._evict())
+
+    def path(self, key):
+        return os.path.join(self.directory, self._name(key) + '.opus')
+
+    def _name(self, key):
+        return re.sub(r'[^A-Za-z0-9_-]', '_', key)
+
+    def get(self, key):
+        """Return the path of a cached track, or None if it is not cached
+
+        Only the in-memory index is consulted; the cache directory belongs to this process.
+        """
+        name = self._name(key)
+        if name in self.files:
+            path = self.path(key)
+            # Keep the LRU order across restarts through the file mtime
+            self._in_background(os.utime, path)
+            self.files.move_to_end(name)
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def _in_background(self, func, *args):
+        """Run a filesystem call in a thread without waiting for it"""
+        task = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        self._io_tasks.add(task)
+        task.add_done_callback(self._io_done)
+
+    def _io_done(self, task):
+        self._io_tasks.discard(task)
+        if not task.cancelled() and task.exception() and not isinstance(task.exception(), FileNotFoundError):
+            print(f'Audio cache file operation failed: {task.exception()}')
+
+    def record_play(self, key, data):
+        """Count a streamed play and start caching the track once it is popular"""
+        plays = self.plays.get(key, 0, count=False) + 1
+        self.plays.set(key, plays)
+        if plays < self.min_plays or key in self._pending or not self.cacheable(data):
+            return
+        self._pending.add(key)
+        task = asyncio.ensure_future(self.store(key, data))
+        task.add_done_callback(lambda t: self._store_done(key, t))
+
+    def _store_done(self, key, task):
+        self._pending.discard(key)
+        if not task.cancelled() and task.exception():
+            print(f'Failed to cache {key}: {task.exception()}')
+
+    def cacheable(self, data):
+        if data.get('is_live') or not data.get('url'):
+            return False
+        duration = data.get('duration')
+        return duration is not None and duration <= self.max_duration
+
+    async def store(self, key, data):
+        """Transcode a stream to an Opus file in the background"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._transcodes)
+
+        path = self.path(key)
+        temp_path = path + '.part'
+        # Remux streams that already carry Opus, encode everything else
+        codec = ['-c:a', 'copy'] if data.get('acodec') == 'opus' else ['-c:a', 'libopus', '-b:a', '128k']
+
+        async with self._semaphore:
+            process = await asyncio.create_subprocess_exec(
+                'ffmpeg', '-nostdin', '-loglevel', 'error',
+                '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                '-i', data['url'], '-vn', '-map_metadata', '-1',
+                *codec, '-ar', '48000', '-ac', '2', '-f', 'ogg', '-y', temp_path,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                _, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                process.kill()
+                raise
+            finally:
+                if process.returncode != 0:
+                    await asyncio.to_thread(remove_files, [temp_path])
+
+        if process.returncode != 0:
+            print(f'Failed to cache {key}: {stderr.decode(errors="replace").strip()}')
+            return
+
+        size = await asyncio.to_thread(self._commit, temp_path, path)
+        name = self._name(key)
+        self.total_bytes -= self.files.pop(name, 0)
+        self.files[name] = size
+        self.total_bytes += size
+        await asyncio.to_thread(remove_files, self._evict())
+
+    @staticmethod
+    def _commit(temp_path, path):
+        os.replace(temp_path, path)
+        return os.path.getsize(path)
+
+    def _evict(self):
+        """Drop least recently played files from the index until the cache fits its byte budget
+
+        Returns the paths of the dropped files for the caller to delete.
+        """
+        paths = []
+        while self.total_bytes > self.max_bytes and self.files:
+            name, size = self.files.popitem(last=False)
+            self.total_bytes -= size
+            paths.append(os.path.join(self.directory, name + '.opus'))
+        return paths
+
+    def stats(self):
+        return {
+            'files': len(self.files),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'pending': len(self._pending)
+        }
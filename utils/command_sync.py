@@ -0,0 +1,32 @@
+import hashlib
+import json
+import os
+from utils.config_store import get_store
+
+# Set to 1 to sync the command tree on every start even if it did not change
+FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', '0') == '1'
+
+def command_schema_hash(tree):
+    """Hash of the global command payload that a sync would upload"""
+    payload = [command.to_dict(tree) for command in tree.get_commands()]
+    payload.sort(key=lambda command: command['name'])
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+async def sync_commands(bot, force=FORCE_COMMAND_SYNC):
+    """Sync the global command tree only when its schema changed since the last successful sync
+
+    Returns the number of synced commands, or None when the sync was skipped.
+    """
+    store = get_store('command_sync')
+    # Keyed by application so switching the bot token always syncs
+    application_id = bot.application_id
+    schema_hash = command_schema_hash(bot.tree)
+    stored = store.get(application_id, {})
+    if not force and stored.get('hash') == schema_hash:
+        return None
+
+    synced = await bot.tree.sync()
+    store.set(application_id, {'hash': schema_hash, 'commands': len(synced)})
+    await store.flush()
+    return len(synced)
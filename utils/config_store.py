@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+
+# SQLite database holding every guild config, one row per guild and store
+DATABASE_PATH = os.getenv('DATABASE_PATH', os.path.join('data', 'bot.db'))
+
+# Seconds to wait for more changes before writing them to the database
+SAVE_DELAY = 2.0
+
+_database = None
+_stores = {}
+
+class Database:
+    """SQLite connection in WAL mode shared by all config stores"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        # Writes run on worker threads; the lock keeps them from interleaving
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('PRAGMA busy_timeout=5000')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS guild_config ('
+            'store TEXT NOT NULL, '
+            'guild_id TEXT NOT NULL, '
+            'config TEXT NOT NULL, '
+            'PRIMARY KEY (store, guild_id)'
+            ') WITHOUT ROWID'
+        )
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY) WITHOUT ROWID'
+        )
+
+    def load(self, store):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT guild_id, config FROM guild_config WHERE store = ?', (store,)
+            ).fetchall()
+        return {guild_id: json.loads(config) for guild_id, config in rows}
+
+    def write(self, store, upserts, deletes):
+        """Upsert and delete guild rows of a store in one transaction"""
+        with self.lock:
+            self.connection.execute('BEGIN')
+            try:
+                self.connection.executemany(
+                    'INSERT INTO guild_config (store, guild_id, config) VALUES (?, ?, ?) '
+                    'ON CONFLICT (store, guild_id) DO UPDATE SET config = excluded.config',
+                    [(store, guild_id, config) for guild_id, config in upserts]
+                )
+                self.connection.executemany(
+                    'DELETE FROM guild_config WHERE store = ? AND guild_id = ?',
+                    [(store, guild_id) for guild_id in deletes]
+                )
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+
+    def migrate_json(self, store, path):
+        """Import a legacy JSON config file once; rows already in the database win"""
+        name = f'json:{store}'
+        with self.lock:
+            if self.connection.execute('SELECT 1 FROM migrations WHERE name = ?', (name,)).fetchone():
+                return 0
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    legacy = json.load(f)
+            except FileNotFoundError:
+                legacy = {}
+
+            self.connection.execute('BEGIN')
+            try:
+                self.connection.executemany(
+                    'INSERT OR IGNORE INTO guild_config (store, guild_id, config) VALUES (?, ?, ?)',
+                    [(store, str(guild_id), json.dumps(config)) for guild_id, config in legacy.items()]
+                )
+                self.connection.execute('INSERT INTO migrations (name) VALUES (?)', (name,))
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+        if legacy:
+            print(f'Migrated {len(legacy)} guild config(s) from {path}')
+        return len(legacy)
+
+class ConfigStore:
+    """Per-guild config kept in memory and persisted to SQLite with debounced writes off the event loop"""
+
+    def __init__(self, database, name, legacy_path=None, save_delay=SAVE_DELAY):
+        self.database = database
+        self.name = name
+        self.save_delay = save_delay
+        if legacy_path:
+            database.migrate_json(name, legacy_path)
+        self.data = database.load(name)
+        self._dirty = set()
+        self._save_task = None
+
+    def get(self, guild_id, default=None):
+        return self.data.get(str(guild_id), default)
+
+    def set(self, guild_id, config):
+        self.data[str(guild_id)] = config
+        self.save(guild_id)
+
+    def update(self, guild_id, **changes):
+        """Merge changes into a guild's config, creating it if needed"""
+        config = self.data.setdefault(str(guild_id), {})
+        config.update(changes)
+        self.save(guild_id)
+        return config
+
+    def delete(self, guild_id):
+        self.data.pop(str(guild_id), None)
+        self.save(guild_id)
+
+    def save(self, guild_id):
+        """Schedule a write of one guild's row; changes made before it runs are written together"""
+        self._dirty.add(str(guild_id))
+        if self._save_task is None or self._save_task.done():
+            try:
+                self._save_task = asyncio.get_running_loop().create_task(self._delayed_save())
+            except RuntimeError:
+                # No event loop (e.g. a script), write right away
+                self.database.write(self.name, *self._take_changes())
+
+    async def _delayed_save(self):
+        await asyncio.sleep(self.save_delay)
+        # Changes made from here on schedule a new write
+        self._save_task = None
+        await asyncio.to_thread(self.database.write, self.name, *self._take_changes())
+
+    async def flush(self):
+        """Write pending changes now instead of waiting for the debounce"""
+        if self._save_task is not None:
+            self._save_task.cancel()
+            self._save_task = None
+        if self._dirty:
+            await asyncio.to_thread(self.database.write, self.name, *self._take_changes())
+
+    def _take_changes(self):
+        # Serialize on the loop so the writer thread never sees a dict being modified
+        upserts = []
+        deletes = []
+        for guild_id in self._dirty:
+            if guild_id in self.data:
+                upserts.append((guild_id, json.dumps(self.data[guild_id])))
+            else:
+                deletes.append(guild_id)
+        self._dirty.clear()
+        return upserts, deletes
+
+    @property
+    def dirty(self):
+        return bool(self._dirty)
+
+def get_database():
+    global _database
+    if _database is None:
+        _database = Database(DATABASE_PATH)
+    return _database
+
+def get_store(name, legacy_path=None):
+    """Return the shared store for a config, migrating its legacy JSON file on first use"""
+    if name not in _stores:
+        _stores[name] = ConfigStore(get_database(), name, legacy_path)
+    return _stores[name]
@@ -0,0 +1,104 @@
+import asyncio
+import itertools
+import os
+import random
+import discord
+from utils.cache import TTLCache
+
+# Dispatcher configuration
+DM_CONCURRENCY = int(os.getenv('DM_CONCURRENCY', 2))
+DM_QUEUE_SIZE = int(os.getenv('DM_QUEUE_SIZE', 5000))
+DM_MAX_RETRIES = 3
+DM_BACKOFF_BASE = 2.0
+DM_BACKOFF_MAX = 60.0
+# Users with closed DMs are skipped for this long
+DM_CLOSED_TTL = 24 * 3600
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+class DMDispatcher:
+    """Background queue that sends DMs with bounded concurrency and retries"""
+
+    def __init__(self, concurrency=DM_CONCURRENCY, queue_size=DM_QUEUE_SIZE):
+        self.concurrency = concurrency
+        self.queue = asyncio.PriorityQueue(maxsize=queue_size)
+        self.closed = TTLCache(maxsize=100000, ttl=DM_CLOSED_TTL)
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.skipped = 0
+        self.dropped = 0
+        self._order = itertools.count()
+        self._workers = []
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    def submit(self, user, priority=PRIORITY_NORMAL, **kwargs):
+        """Queue a DM, return False if the user has closed DMs or the queue is full"""
+        if self.closed.get(user.id) is not None:
+            self.skipped += 1
+            return False
+        try:
+            # The counter keeps equal priorities in submission order
+            self.queue.put_nowait((priority, next(self._order), user, kwargs, 0))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    async def _worker(self):
+        while True:
+            priority, order, user, kwargs, attempts = await self.queue.get()
+            try:
+                await self._send(priority, order, user, kwargs, attempts)
+            except Exception as e:
+                # One bad message must not stop the worker for the rest of the queue
+                self.failed += 1
+                print(f"Unexpected error sending DM to {user.name}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _send(self, priority, order, user, kwargs, attempts):
+        if self.closed.get(user.id) is not None:
+            self.skipped += 1
+            return
+        try:
+            await user.send(**kwargs)
+            self.sent += 1
+        except discord.Forbidden:
+            self.closed.set(user.id, True)
+            self.failed += 1
+            print(f"Cannot send DM to {user.name}")
+        except discord.HTTPException as e:
+            if (e.status == 429 or e.status >= 500) and attempts < DM_MAX_RETRIES:
+                # Back off while holding the worker so every DM slows down, not just this one
+                delay = min(DM_BACKOFF_MAX, DM_BACKOFF_BASE ** (attempts + 1)) * random.uniform(0.5, 1.5)
+                self.retried += 1
+                await asyncio.sleep(delay)
+                try:
+                    self.queue.put_nowait((priority, order, user, kwargs, attempts + 1))
+                except asyncio.QueueFull:
+                    self.dropped += 1
+            else:
+                self.failed += 1
+                print(f"Failed to send DM to {user.name}: {e}")
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'skipped': self.skipped,
+            'dropped': self.dropped,
+            'closed_cache': len(self.closed)
+        }
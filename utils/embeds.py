@@ -1,5 +1,17 @@
 import discord
-from datetime import datetime
+import time
+from datetime import datetime, timezone
+
+_clock = (None, None, None)
+
+def _now():
+    """Current UTC time and its ISO string, computed at most once per second"""
+    global _clock
+    second = int(time.time())
+    if _clock[0] != second:
+        now = datetime.fromtimestamp(second, tz=timezone.utc)
+        _clock = (second, now, now.isoformat())
+    return _clock[1], _clock[2]
 
 def create_embed(title=None, description=None, color=None, footer=None, timestamp=True):
     """Create a standard embed with consistent styling"""
@@ -14,7 +26,7 @@ def create_embed(title=None, description=None, color=None, footer=None, timestam
     )
     
     if timestamp:
-        embed.timestamp = datetime.utcnow()
+        embed.timestamp = _now()[0]
     
     if footer:
         embed.set_footer(text=footer)
@@ -52,3 +64,123 @@ def create_warning_embed(title, description):
         description=description,
         color=discord.Color.orange()
     )
+
+class TemplateEmbed(discord.Embed):
+    """Embed created from a template that reuses the template's payload until it is modified"""
+
+    def __setattr__(self, name, value):
+        if name in ('title', 'description', 'url', 'type', 'colour', 'color', 'timestamp'):
+            object.__setattr__(self, '_payload', None)
+        super().__setattr__(name, value)
+
+    def to_dict(self):
+        payload = self.__dict__.get('_payload')
+        if payload is not None:
+            return dict(payload)
+        return super().to_dict()
+
+def _invalidating(name):
+    method = getattr(discord.Embed, name)
+
+    def wrapper(self, *args, **kwargs):
+        self._payload = None
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+for _name in ('add_field', 'insert_field_at', 'set_field_at', 'remove_field', 'clear_fields',
+              'set_footer', 'remove_footer', 'set_image', 'set_thumbnail', 'set_author', 'remove_author'):
+    setattr(TemplateEmbed, _name, _invalidating(_name))
+
+class EmbedTemplate:
+    """Embed whose immutable parts are built once; create() returns a cheap copy per response"""
+
+    def __init__(self, title=None, description=None, color=None, footer=None, timestamp=True):
+        self.timestamp = timestamp
+        self.prototype = create_embed(title, description, color, footer, timestamp=False)
+        self.payload = self.prototype.to_dict()
+
+    def create(self):
+        prototype = self.prototype
+        embed = TemplateEmbed.__new__(TemplateEmbed)
+        # Copy the prebuilt state directly, bypassing Embed.__init__ and the invalidation hook
+        set_attr = object.__setattr__
+        set_attr(embed, 'title', prototype.title)
+        set_attr(embed, 'type', prototype.type)
+        set_attr(embed, 'description', prototype.description)
+        set_attr(embed, 'url', prototype.url)
+        set_attr(embed, '_colour', prototype._colour)
+        set_attr(embed, '_flags', prototype._flags)
+        payload = dict(self.payload)
+        if 'footer' in payload:
+            payload['footer'] = dict(payload['footer'])
+            set_attr(embed, '_footer', payload['footer'])
+        if self.timestamp:
+            now, iso = _now()
+            set_attr(embed, '_timestamp', now)
+            payload['timestamp'] = iso
+        set_attr(embed, '_payload', payload)
+        return embed
+
+EMBED_TEMPLATES = {}
+
+def register_embed(name, title=None, description=None, color=None, footer=None, timestamp=True):
+    """Register a static embed that is prebuilt once and copied on every use"""
+    EMBED_TEMPLATES[name] = EmbedTemplate(title, description, color, footer, timestamp)
+    return EMBED_TEMPLATES[name]
+
+def template_embed(name):
+    """Create a fresh copy of a registered embed"""
+    return EMBED_TEMPLATES[name].create()
+
+# Static responses shared by the cogs
+register_embed(
+    'permission_denied',
+    title="❌ Permission Denied",
+    description="You need Administrator permissions to use this command.",
+    color=discord.Color.red()
+)
+register_embed(
+    'not_in_voice',
+    title="❌ Not in Voice Channel",
+    description="You need to join a voice channel first to use this command.",
+    color=discord.Color.red()
+)
+register_embed(
+    'missing_voice_permissions',
+    title="❌ Missing Permissions",
+    description="I need permission to connect and speak in voice channels.",
+    color=discord.Color.red()
+)
+register_embed(
+    'not_connected',
+    title="❌ Not Connected",
+    description="I'm not connected to a voice channel.",
+    color=discord.Color.red()
+)
+register_embed(
+    'not_playing',
+    title="❌ Not Playing",
+    description="No music is currently playing.",
+    color=discord.Color.red()
+)
+register_embed(
+    'not_paused',
+    title="❌ Not Paused",
+    description="Music is not currently paused.",
+    color=discord.Color.red()
+)
+register_embed(
+    'music_busy',
+    title="⏳ Music Service Busy",
+    description="Too many songs are being loaded right now. Please try again in a moment.",
+    color=discord.Color.orange()
+)
+register_embed(
+    'queue_empty',
+    title="📭 Queue Empty",
+    description="There are no tracks in the queue.",
+    color=discord.Color.blue()
+)
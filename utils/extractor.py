@@ -0,0 +1,125 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import yt_dlp
+
+# Extractor pool configuration
+EXTRACTOR_WORKERS = int(os.getenv('YTDL_WORKERS', min(4, os.cpu_count() or 1)))
+EXTRACTOR_MAX_PENDING = int(os.getenv('YTDL_MAX_PENDING', 64))
+
+# YoutubeDL instances owned by each worker process, keyed by option overrides;
+# instances are not thread-safe
+_worker_options = None
+_worker_ytdl = {}
+
+def _init_worker(options):
+    global _worker_options
+    _worker_options = options
+
+def _get_ytdl(overrides):
+    if overrides not in _worker_ytdl:
+        _worker_ytdl[overrides] = yt_dlp.YoutubeDL({**_worker_options, **dict(overrides)})
+    return _worker_ytdl[overrides]
+
+def _extract(query, download, overrides=()):
+    ytdl = _get_ytdl(overrides)
+    try:
+        data = ytdl.extract_info(query, download=download)
+    except Exception as e:
+        # yt-dlp errors carry tracebacks that cannot be pickled back to the bot
+        raise ExtractionError(str(e)) from None
+    # Only plain JSON-like data can be sent back to the bot process
+    return ytdl.sanitize_info(data)
+
+class ExtractionError(Exception):
+    """Exception raised when yt-dlp fails to extract a track"""
+    pass
+
+class ExtractorBusy(Exception):
+    """Exception raised when too many extractions are already waiting"""
+    pass
+
+class ExtractorPool:
+    """Bounded pool of worker processes running yt-dlp extraction"""
+
+    def __init__(self, options, workers=EXTRACTOR_WORKERS, max_pending=EXTRACTOR_MAX_PENDING, histogram=None):
+        self.options = options
+        # Optional histogram observing (seconds, status) of every extraction
+        self.histogram = histogram
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.pending = 0
+        self.running = 0
+        self._executor = None
+        self._semaphore = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            # Spawn instead of fork so workers do not inherit the bot's threads and sockets.
+            # Spawned workers re-import the main script, so main.py only builds the bot in main()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.options,)
+            )
+        return self._executor
+
+    async def extract(self, query, *, download=False, options=None):
+        """Extract track info in a worker process, rejecting work past the queue limit
+
+        options overrides the pool's yt-dlp options for this call only.
+        """
+        if self.pending >= self.max_pending:
+            raise ExtractorBusy(f'{self.pending} extractions are already queued')
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        self.pending += 1
+        try:
+            # Only hand jobs to the executor when a worker is free, so cancelled
+            # requests never leave stale work queued inside the pool
+            async with self._semaphore:
+                self.running += 1
+                start = time.perf_counter()
+                status = 'error'
+                try:
+                    loop = asyncio.get_running_loop()
+                    overrides = tuple(sorted((options or {}).items()))
+                    executor = self.executor
+                    try:
+                        info = await loop.run_in_executor(executor, _extract, query, download, overrides)
+                    except BrokenProcessPool:
+                        # A worker died (e.g. killed for memory); the pool can't be used again,
+                        # so the next call starts a new one
+                        if self._executor is executor:
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            self._executor = None
+                        raise ExtractionError('yt-dlp worker process died') from None
+                    status = 'ok'
+                    return info
+                finally:
+                    self.running -= 1
+                    if self.histogram is not None:
+                        self.histogram.observe(time.perf_counter() - start, status)
+        finally:
+            self.pending -= 1
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'running': self.running,
+            'pending': self.pending,
+            'max_pending': self.max_pending
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._semaphore = None
@@ -0,0 +1,85 @@
+import os
+import time
+from collections import OrderedDict
+from discord.ext import tasks
+
+# Request every guild's member list when the bot connects (the discord.py default).
+# Off by default: guilds are chunked the first time a command needs their members
+MEMBER_CHUNK_AT_STARTUP = os.getenv('MEMBER_CHUNK_AT_STARTUP', '0') == '1'
+# Guilds whose full member list is kept at once, 0 for no limit
+MEMBER_CACHE_GUILDS = int(os.getenv('MEMBER_CACHE_GUILDS', 50))
+# Seconds without a command before a guild's member list is dropped again
+MEMBER_CACHE_IDLE = int(os.getenv('MEMBER_CACHE_IDLE', 1800))
+MEMBER_CACHE_SWEEP_INTERVAL = 300
+
+class MemberCache:
+    """Chunks guild member lists on demand and evicts the least recently used ones"""
+
+    def __init__(self, bot, max_guilds=MEMBER_CACHE_GUILDS, idle_timeout=MEMBER_CACHE_IDLE,
+                 enabled=not MEMBER_CHUNK_AT_STARTUP):
+        self.bot = bot
+        self.max_guilds = max_guilds
+        self.idle_timeout = idle_timeout
+        # With startup chunking every guild stays fully cached and nothing is evicted
+        self.enabled = enabled
+        self.chunks = 0
+        self.evictions = 0
+        self.chunk_time = 0.0
+        self._used = OrderedDict()
+
+    def start(self):
+        if self.enabled:
+            self.sweep.start()
+
+    def is_cached(self, guild):
+        return guild.chunked
+
+    async def ensure(self, guild):
+        """Make sure a guild's full member list is cached and mark it as recently used"""
+        if not guild.chunked:
+            start = time.perf_counter()
+            # discord.py shares one request between concurrent callers for the same guild
+            await guild.chunk(cache=True)
+            self.chunk_time += time.perf_counter() - start
+            self.chunks += 1
+        if not self.enabled:
+            return
+        self._used[guild.id] = time.monotonic()
+        self._used.move_to_end(guild.id)
+        while self.max_guilds and len(self._used) > self.max_guilds:
+            guild_id, _ = self._used.popitem(last=False)
+            self.evict(guild_id)
+
+    def evict(self, guild_id):
+        """Drop a guild's cached members except the bot and members in voice channels"""
+        self._used.pop(guild_id, None)
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return
+        keep = set(guild._voice_states)
+        keep.add(self.bot.user.id)
+        # discord.py has no public way to shrink a guild's member cache
+        guild._members = {member_id: member for member_id, member in guild._members.items() if member_id in keep}
+        self.evictions += 1
+        self.bot.dispatch('member_cache_evict', guild)
+
+    @tasks.loop(seconds=MEMBER_CACHE_SWEEP_INTERVAL)
+    async def sweep(self):
+        """Evict member lists of guilds nobody used for a while"""
+        deadline = time.monotonic() - self.idle_timeout
+        for guild_id, last_used in list(self._used.items()):
+            if last_used < deadline:
+                self.evict(guild_id)
+
+    @sweep.before_loop
+    async def before_sweep(self):
+        await self.bot.wait_until_ready()
+
+    def stats(self):
+        return {
+            'cached_guilds': len(self._used),
+            'max_guilds': self.max_guilds,
+            'chunks': self.chunks,
+            'evictions': self.evictions,
+            'chunk_time': self.chunk_time
+        }
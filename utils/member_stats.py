@@ -0,0 +1,92 @@
+import asyncio
+import discord
+
+# Members counted per step of a reconciliation before yielding to the event loop
+RECONCILE_CHUNK = 5000
+
+class MemberStats:
+    """Bot and online counters of one guild"""
+
+    __slots__ = ('bots', 'online')
+
+    def __init__(self, bots=0, online=0):
+        self.bots = bots
+        self.online = online
+
+def is_online(member):
+    return member.status != discord.Status.offline
+
+class MemberIndex:
+    """Per-guild member counters kept up to date from gateway events"""
+
+    def __init__(self):
+        self.guilds = {}
+        self.reconciles = 0
+        self.drift = 0
+
+    def get(self, guild):
+        """Return the counters of a guild, counting its members once if it was never indexed"""
+        stats = self.guilds.get(guild.id)
+        if stats is None:
+            stats = self.count(guild.members)
+            self.guilds[guild.id] = stats
+        return stats
+
+    def count(self, members):
+        stats = MemberStats()
+        for member in members:
+            if member.bot:
+                stats.bots += 1
+            if is_online(member):
+                stats.online += 1
+        return stats
+
+    def member_join(self, member):
+        stats = self.guilds.get(member.guild.id)
+        if stats is None:
+            return
+        if member.bot:
+            stats.bots += 1
+        if is_online(member):
+            stats.online += 1
+
+    def member_remove(self, member):
+        stats = self.guilds.get(member.guild.id)
+        if stats is None:
+            return
+        if member.bot:
+            stats.bots = max(0, stats.bots - 1)
+        if is_online(member):
+            stats.online = max(0, stats.online - 1)
+
+    def presence_update(self, before, after):
+        stats = self.guilds.get(after.guild.id)
+        if stats is None:
+            return
+        was_online = is_online(before)
+        now_online = is_online(after)
+        if was_online and not now_online:
+            stats.online = max(0, stats.online - 1)
+        elif now_online and not was_online:
+            stats.online += 1
+
+    def forget(self, guild_id):
+        self.guilds.pop(guild_id, None)
+
+    async def reconcile(self, guild):
+        """Recount a guild in chunks so large guilds don't block the event loop"""
+        members = list(guild.members)
+        stats = MemberStats()
+        for start in range(0, len(members), RECONCILE_CHUNK):
+            chunk = self.count(members[start:start + RECONCILE_CHUNK])
+            stats.bots += chunk.bots
+            stats.online += chunk.online
+            await asyncio.sleep(0)
+
+        # Events that arrived while counting are folded into the next reconciliation
+        old = self.guilds.get(guild.id)
+        if old is not None:
+            self.drift += abs(old.bots - stats.bots) + abs(old.online - stats.online)
+        self.guilds[guild.id] = stats
+        self.reconciles += 1
+        return stats
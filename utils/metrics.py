@@ -0,0 +1,245 @@
+import asyncio
+import bisect
+import os
+import time
+import discord
+from discord import app_commands
+from aiohttp import web
+from utils.sharding import shard_stats
+
+# Serve Prometheus metrics on this port, disabled when unset
+METRICS_PORT = int(os.getenv('METRICS_PORT')) if os.getenv('METRICS_PORT') else None
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+# Seconds between event loop lag samples
+LOOP_LAG_INTERVAL = 0.5
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """Prometheus histogram with one series per combination of label values"""
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            # Per-bucket counts, then sum and count
+            series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                labels = format_labels(self.labels + ('le',), label_values + (format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {format_value(series[-2])}')
+            lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+class Registry:
+    """Histograms updated as things happen, plus collectors that read gauges at scrape time"""
+
+    def __init__(self):
+        self.histograms = []
+        self.collectors = []
+
+    def histogram(self, *args, **kwargs):
+        histogram = Histogram(*args, **kwargs)
+        self.histograms.append(histogram)
+        return histogram
+
+    def render(self):
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        for collector in self.collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                print(f'Metrics collector {collector.__name__} failed: {e}')
+                continue
+            # Samples are (name, type, documentation, labels dict, value); each metric is written as one group
+            metrics = {}
+            for name, kind, documentation, labels, value in samples:
+                if name not in metrics:
+                    metrics[name] = [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}']
+                metrics[name].append(f'{name}{format_labels(tuple(labels), tuple(labels.values()))} {format_value(value)}')
+            for metric in metrics.values():
+                lines.extend(metric)
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+command_duration = registry.histogram(
+    'discord_command_duration_seconds', 'Time spent handling a slash command',
+    labels=('command', 'status')
+)
+extraction_duration = registry.histogram(
+    'ytdl_extraction_duration_seconds', 'Time spent extracting track info with yt-dlp',
+    labels=('status',), buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+)
+loop_lag = registry.histogram(
+    'event_loop_lag_seconds', 'How late the event loop woke up a sleeping task',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+
+class MetricsCommandTree(app_commands.CommandTree):
+    """Command tree that times every slash command"""
+
+    async def _call(self, interaction):
+        # Every application command goes through here, so one override covers all cogs
+        start = time.perf_counter()
+        failed = True
+        try:
+            await super()._call(interaction)
+            failed = interaction.command_failed
+        finally:
+            if interaction.type is discord.InteractionType.application_command:
+                command = interaction.command
+                name = command.qualified_name if command else interaction.data.get('name', 'unknown')
+                command_duration.observe(time.perf_counter() - start, name, 'error' if failed else 'ok')
+
+class LoopLagMonitor:
+    """Measures how much later than requested the event loop resumes a sleep"""
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.last = lag
+            self.max = max(self.max, lag)
+            loop_lag.observe(lag)
+
+def bot_collector(bot, lag_monitor):
+    """Gauges read from the bot and its cogs when metrics are scraped"""
+
+    def collect():
+        yield ('event_loop_lag_last_seconds', 'gauge', 'Most recent event loop lag sample', {}, lag_monitor.last)
+        yield ('event_loop_lag_max_seconds', 'gauge', 'Largest event loop lag since start', {}, lag_monitor.max)
+        for shard in shard_stats(bot):
+            latency = shard['latency']
+            if latency == latency and latency != float('inf'):
+                yield ('discord_gateway_latency_seconds', 'gauge', 'Heartbeat latency of a shard',
+                       {'shard': shard['shard_id']}, latency)
+            yield ('discord_guilds', 'gauge', 'Guilds on a shard', {'shard': shard['shard_id']}, shard['guilds'])
+        yield ('discord_voice_sessions', 'gauge', 'Connected voice clients', {}, len(bot.voice_clients))
+
+        music = bot.get_cog('MusicCog')
+        if music is not None:
+            stats = music.stats()
+            yield ('music_queue_depth', 'gauge', 'Tracks waiting in all music queues', {}, stats['queued_tracks'])
+            yield ('music_queue_depth_max', 'gauge', 'Tracks waiting in the longest music queue', {}, stats['longest_queue'])
+            yield ('music_ffmpeg_processes', 'gauge', 'Running FFmpeg processes', {}, stats['ffmpeg_processes'])
+            yield ('ytdl_extractions_running', 'gauge', 'yt-dlp extractions running in workers', {}, stats['extractor']['running'])
+            yield ('ytdl_extractions_pending', 'gauge', 'yt-dlp extractions queued or running', {}, stats['extractor']['pending'])
+            yield from cache_samples('ytdl_extraction_cache', stats['extraction_cache'])
+            flight = stats['extraction_flight']
+            yield ('ytdl_extractions_calls_total', 'counter', 'Track lookups that missed the extraction cache', {}, flight['calls'])
+            yield ('ytdl_extractions_coalesced_total', 'counter', 'Track lookups that joined an extraction already running',
+                   {}, flight['coalesced'])
+
+        welcome_dm = bot.get_cog('WelcomeDMCog')
+        if welcome_dm is not None:
+            stats = welcome_dm.dispatcher.stats()
+            yield ('welcome_dm_queue_depth', 'gauge', 'Welcome DMs waiting to be sent', {}, stats['queued'])
+            for result in ('sent', 'failed', 'retried', 'skipped', 'dropped'):
+                yield ('welcome_dm_total', 'counter', 'Welcome DMs by result', {'result': result}, stats[result])
+
+        server = bot.get_cog('ServerCog')
+        if server is not None:
+            yield from cache_samples('serverinfo_cache', server.stats()['serverinfo_cache'])
+
+        stall_detector = getattr(bot, 'stall_detector', None)
+        if stall_detector is not None:
+            yield ('event_loop_stalls_total', 'counter', 'Times the event loop was blocked past the stall threshold',
+                   {}, stall_detector.stalls)
+            yield ('event_loop_stalled_seconds_total', 'counter', 'Time the event loop spent in stalls',
+                   {}, stall_detector.stalled_time)
+
+        member_cache = getattr(bot, 'member_cache', None)
+        if member_cache is not None:
+            stats = member_cache.stats()
+            yield ('member_cache_guilds', 'gauge', 'Guilds with their full member list cached', {}, stats['cached_guilds'])
+            yield ('member_cache_chunks_total', 'counter', 'Guild member lists requested', {}, stats['chunks'])
+            yield ('member_cache_evictions_total', 'counter', 'Guild member lists evicted', {}, stats['evictions'])
+
+    return collect
+
+def cache_samples(prefix, stats):
+    yield (f'{prefix}_size', 'gauge', 'Entries in the cache', {}, stats['size'])
+    yield (f'{prefix}_hits_total', 'counter', 'Cache lookups that found an entry', {}, stats['hits'])
+    yield (f'{prefix}_misses_total', 'counter', 'Cache lookups that found nothing', {}, stats['misses'])
+    yield (f'{prefix}_hit_ratio', 'gauge', 'Share of lookups that were hits', {}, stats['hit_rate'])
+
+class MetricsServer:
+    """Local HTTP endpoint serving the registry in Prometheus text format"""
+
+    def __init__(self, bot, host=METRICS_HOST, port=METRICS_PORT):
+        self.host = host
+        self.port = port
+        self.lag_monitor = LoopLagMonitor()
+        self.collector = bot_collector(bot, self.lag_monitor)
+        self._runner = None
+
+    async def handle(self, request):
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self):
+        registry.collectors.append(self.collector)
+        self.lag_monitor.start()
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f'Serving metrics on http://{self.host}:{self.port}/metrics')
+
+    async def stop(self):
+        self.lag_monitor.stop()
+        if self.collector in registry.collectors:
+            registry.collectors.remove(self.collector)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
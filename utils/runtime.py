@@ -0,0 +1,56 @@
+import asyncio
+import os
+import platform
+import aiohttp
+import discord
+
+# Opt-in high-performance runtime: uvloop when installed and a tuned HTTP connector
+FAST_RUNTIME = os.getenv('FAST_RUNTIME', '0') == '1'
+# Connector settings used by the fast runtime
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 100))
+HTTP_DNS_TTL = int(os.getenv('HTTP_DNS_TTL', 300))
+HTTP_KEEPALIVE = float(os.getenv('HTTP_KEEPALIVE', 30))
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+def loop_factory():
+    """Event loop constructor for the selected runtime, None for asyncio's default"""
+    if FAST_RUNTIME and uvloop is not None:
+        return uvloop.new_event_loop
+    return None
+
+def run(coro):
+    """asyncio.run with the selected event loop"""
+    with asyncio.Runner(loop_factory=loop_factory()) as runner:
+        return runner.run(coro)
+
+def make_connector():
+    """Connector for discord.py's HTTP client, None keeps discord.py's default"""
+    if not FAST_RUNTIME:
+        return None
+    # Must be created on the running loop
+    return aiohttp.TCPConnector(
+        limit=HTTP_POOL_SIZE,
+        ttl_dns_cache=HTTP_DNS_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE,
+        enable_cleanup_closed=True
+    )
+
+def banner(connector=None):
+    """Startup line describing the runtime that was selected"""
+    loop = asyncio.get_running_loop()
+    if uvloop is not None and isinstance(loop, uvloop.Loop):
+        loop_name = f'uvloop {uvloop.__version__}'
+    else:
+        loop_name = 'asyncio'
+        if FAST_RUNTIME:
+            loop_name += ' (uvloop not installed)'
+    if connector is None:
+        http = 'default connector'
+    else:
+        http = f'pool {HTTP_POOL_SIZE}, DNS cache {HTTP_DNS_TTL}s, keepalive {HTTP_KEEPALIVE:g}s'
+    return (f"Runtime: {'fast' if FAST_RUNTIME else 'standard'} | loop {loop_name} | HTTP {http} | "
+            f"Python {platform.python_version()}, discord.py {discord.__version__}, aiohttp {aiohttp.__version__}")
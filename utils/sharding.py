@@ -0,0 +1,67 @@
+import os
+import discord
+
+# Total number of shards across all processes; unset lets Discord recommend one
+SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+# Shards run by this process, e.g. "0,1,2" or "0-7"; set by launcher.py
+SHARD_IDS = os.getenv('SHARD_IDS')
+# Use AutoShardedBot even without explicit shard settings
+SHARDED = os.getenv('SHARDED', '0') == '1' or SHARD_COUNT is not None
+
+def parse_shard_ids(value):
+    """Parse "0,1,5-7" into [0, 1, 5, 6, 7]"""
+    shard_ids = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            shard_ids.extend(range(int(first), int(last) + 1))
+        else:
+            shard_ids.append(int(part))
+    return sorted(set(shard_ids))
+
+def format_shard_ids(shard_ids):
+    return ','.join(str(shard_id) for shard_id in shard_ids)
+
+def shard_ranges(shard_count, workers):
+    """Split shards into contiguous ranges of nearly equal size, one per worker process"""
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for worker in range(workers):
+        end = start + size + (1 if worker < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+def bot_options():
+    """Keyword arguments selecting the shards this process runs"""
+    if not SHARDED:
+        return {}
+    options = {'shard_count': SHARD_COUNT}
+    if SHARD_IDS:
+        if SHARD_COUNT is None:
+            raise ValueError('SHARD_IDS requires SHARD_COUNT')
+        options['shard_ids'] = parse_shard_ids(SHARD_IDS)
+    return options
+
+def runs_shard_zero(bot):
+    """Whether this process runs shard 0, which takes care of global work like syncing commands"""
+    shard_ids = getattr(bot, 'shard_ids', None)
+    return shard_ids is None or 0 in shard_ids
+
+def shard_stats(bot):
+    """Latency and guild count of every shard this process runs"""
+    if not isinstance(bot, discord.AutoShardedClient):
+        return [{'shard_id': bot.shard_id or 0, 'latency': bot.latency, 'guilds': len(bot.guilds)}]
+
+    guilds = {}
+    for guild in bot.guilds:
+        guilds[guild.shard_id] = guilds.get(guild.shard_id, 0) + 1
+    return [
+        {'shard_id': shard_id, 'latency': shard.latency, 'guilds': guilds.get(shard_id, 0)}
+        for shard_id, shard in sorted(bot.shards.items())
+    ]
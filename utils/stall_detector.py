@@ -0,0 +1,135 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+
+# Report the event loop as stalled when it is blocked longer than this many seconds, off when unset
+LOOP_STALL_THRESHOLD = float(os.getenv('LOOP_STALL_THRESHOLD')) if os.getenv('LOOP_STALL_THRESHOLD') else None
+# Seconds between printed stall reports
+LOOP_STALL_REPORT_INTERVAL = int(os.getenv('LOOP_STALL_REPORT_INTERVAL', 300))
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class StallSite:
+    """Stalls attributed to one line of code"""
+
+    def __init__(self, site, task, stack):
+        self.site = site
+        self.task = task
+        self.stack = stack
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+def call_site(stack):
+    """Innermost frame in the bot's own code, the line most likely to hold the blocking call"""
+    for frame in reversed(stack):
+        path = os.path.abspath(frame.filename)
+        if path.startswith(PROJECT_ROOT) and path != os.path.abspath(__file__):
+            return f'{os.path.relpath(path, PROJECT_ROOT)}:{frame.lineno} in {frame.name}'
+    frame = stack[-1]
+    return f'{frame.filename}:{frame.lineno} in {frame.name}'
+
+def callback_stack(stack):
+    """The part of a stack below asyncio's event loop machinery"""
+    for index in range(len(stack) - 1, -1, -1):
+        if stack[index].filename.endswith(os.path.join('asyncio', 'events.py')):
+            return stack[index + 1:]
+    return stack
+
+class StallDetector:
+    """Watchdog thread that captures the event loop's stack whenever the loop stops responding"""
+
+    def __init__(self, threshold=LOOP_STALL_THRESHOLD, report_interval=LOOP_STALL_REPORT_INTERVAL):
+        self.threshold = threshold
+        self.report_interval = report_interval
+        # The loop updates its heartbeat this often; the watchdog checks at the same rate
+        self.interval = min(0.1, threshold / 4)
+        self.sites = {}
+        self.stalls = 0
+        self.stalled_time = 0.0
+        self._reported = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._beat = time.monotonic()
+        self._loop = None
+        self._loop_thread = None
+        self._tasks = []
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._tasks = [asyncio.create_task(self._heartbeat()), asyncio.create_task(self._report_loop())]
+        threading.Thread(target=self._watch, name='loop-stall-detector', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        pending = None
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            if pending is not None and beat != pending[0]:
+                # The loop is running again; the stall lasted until the heartbeat that ended it
+                stalled_since, site, task, stack = pending
+                self._record(site, task, stack, beat - stalled_since - self.interval)
+                pending = None
+            if pending is None and time.monotonic() - beat > self.threshold + self.interval:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is None:
+                    continue
+                stack = traceback.extract_stack(frame)
+                current = asyncio.current_task(self._loop)
+                task = current.get_name() if current is not None else None
+                pending = (beat, call_site(stack), task, stack)
+
+    def _record(self, site, task, stack, duration):
+        with self._lock:
+            entry = self.sites.get(site)
+            if entry is None:
+                entry = self.sites[site] = StallSite(site, task, stack)
+                print(f'Event loop stalled {duration * 1000:.0f} ms at {site} (task {task}):\n'
+                      + ''.join(traceback.format_list(callback_stack(stack))).rstrip())
+            entry.add(duration)
+            self.stalls += 1
+            self.stalled_time += duration
+
+    def report(self, limit=10):
+        """Call sites ordered by the total time they blocked the loop"""
+        with self._lock:
+            sites = sorted(self.sites.values(), key=lambda entry: entry.total, reverse=True)
+            return [
+                {'site': entry.site, 'task': entry.task, 'count': entry.count, 'total': entry.total, 'max': entry.max}
+                for entry in sites[:limit]
+            ]
+
+    def print_report(self):
+        print(f'Event loop stalls over {self.threshold * 1000:.0f} ms: {self.stalls} '
+              f'({self.stalled_time:.2f} s blocked)')
+        for entry in self.report():
+            print(f"  {entry['count']:>5}x  total {entry['total']:.2f} s  max {entry['max'] * 1000:.0f} ms  "
+                  f"{entry['site']} (task {entry['task']})")
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            # Only print when something new stalled since the last report
+            if self.stalls != self._reported:
+                self._reported = self.stalls
+                self.print_report()
@@ -0,0 +1,137 @@
+import re
+import discord
+
+# Accounts younger than this many days count as new for {#new_account}
+NEW_ACCOUNT_DAYS = 7
+
+# {name} inserts a variable, {#name}...{/name} renders its content when the
+# variable is set and {^name}...{/name} when it is not
+TAG = re.compile(r'\{([#^/]?)([a-z_]+)\}')
+
+class TemplateError(ValueError):
+    """Exception raised when a message template is invalid"""
+    pass
+
+def ordinal(number):
+    if 10 <= number % 100 <= 20:
+        suffix = 'th'
+    else:
+        suffix = {1: 'st', 2: 'nd', 3: 'rd'}.get(number % 10, 'th')
+    return f'{number:,}{suffix}'
+
+def humanize_age(delta):
+    days = delta.days
+    if days >= 365:
+        value, unit = days // 365, 'year'
+    elif days >= 30:
+        value, unit = days // 30, 'month'
+    elif days >= 1:
+        value, unit = days, 'day'
+    else:
+        value, unit = delta.seconds // 3600, 'hour'
+    return f"{value} {unit}{'' if value == 1 else 's'}"
+
+def _account_age(member):
+    return discord.utils.utcnow() - member.created_at
+
+VARIABLES = {
+    'user': lambda member: member.mention,
+    'mention': lambda member: member.mention,
+    'name': lambda member: member.display_name,
+    'server': lambda member: member.guild.name,
+    'member_count': lambda member: str(member.guild.member_count),
+    'member_number': lambda member: ordinal(member.guild.member_count or 0),
+    'joined_at': lambda member: member.joined_at.strftime('%B %d, %Y') if member.joined_at else '',
+    'account_age': lambda member: humanize_age(_account_age(member)),
+    'new_account': lambda member: _account_age(member).days < NEW_ACCOUNT_DAYS
+}
+
+VARIABLE_HELP = (
+    "`{user}` - User mention (name on goodbye)\n"
+    "`{name}` - Display name\n"
+    "`{server}` - Server name\n"
+    "`{member_count}` - Member count\n"
+    "`{member_number}` - Ordinal member number, e.g. 1,234th\n"
+    "`{joined_at}` - Join date\n"
+    "`{account_age}` - Account age, e.g. 3 years\n"
+    "`{#new_account}...{/new_account}` - Only for accounts younger than a week\n"
+    "`{^new_account}...{/new_account}` - Only for older accounts"
+)
+
+class Template:
+    """Message template parsed once and rendered in a single pass"""
+
+    def __init__(self, source, nodes, names):
+        self.source = source
+        self.nodes = nodes
+        self.names = names
+
+    def render(self, member, **overrides):
+        # Only the variables this template uses are computed
+        values = {}
+        for name in self.names:
+            values[name] = overrides[name] if name in overrides else VARIABLES[name](member)
+        parts = []
+        self._render(self.nodes, values, parts)
+        return ''.join(parts)
+
+    def _render(self, nodes, values, parts):
+        for node in nodes:
+            if isinstance(node, str):
+                parts.append(node)
+            elif node[0] == 'var':
+                value = values[node[1]]
+                parts.append(value if isinstance(value, str) else str(value))
+            elif bool(values[node[1]]) != node[2]:
+                self._render(node[3], values, parts)
+
+def compile_template(source, strict=True):
+    """Parse a template into nodes, raising TemplateError for unknown variables or unbalanced sections
+
+    With strict=False, anything invalid is kept as literal text instead, which is
+    how templates saved before validation existed keep working.
+    """
+    root = []
+    stack = [(None, root)]
+    names = set()
+    position = 0
+
+    for match in TAG.finditer(source):
+        kind, name = match.groups()
+        nodes = stack[-1][1]
+        if match.start() > position:
+            nodes.append(source[position:match.start()])
+        position = match.end()
+
+        if name not in VARIABLES:
+            if strict:
+                raise TemplateError(f"Unknown variable `{{{name}}}`")
+            nodes.append(match.group())
+        elif kind == '':
+            nodes.append(('var', name))
+            names.add(name)
+        elif kind in '#^':
+            section = ('section', name, kind == '^', [])
+            nodes.append(section)
+            names.add(name)
+            stack.append((name, section[3]))
+        elif stack[-1][0] == name:
+            stack.pop()
+        elif strict:
+            raise TemplateError(f"`{{/{name}}}` does not close an open section")
+        else:
+            nodes.append(match.group())
+
+    if position < len(source):
+        stack[-1][1].append(source[position:])
+    if len(stack) > 1 and strict:
+        raise TemplateError(f"Section `{{#{stack[-1][0]}}}` is never closed with `{{/{stack[-1][0]}}}`")
+
+    return Template(source, root, frozenset(names))
+
+def load_template(source):
+    """Compile a stored template, falling back to lenient parsing for legacy templates"""
+    try:
+        return compile_template(source)
+    except TemplateError:
+        return compile_template(source, strict=False)